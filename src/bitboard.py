@@ -0,0 +1,477 @@
+"""
+Houses a bitboard representation of the board and a move generator built on it, used by the search.
+
+Each colour is stored as a single 61-bit integer where bit i is set if the cell CELLS[i] holds a marble of that colour.
+Moving a set of marbles one step in a direction is a handful of shift-and-mask operations, so the generator works on
+whole sets of marbles at once instead of building coordinate tuples for every neighbour.
+"""
+from collections.abc import Mapping
+from typing import Dict, List, Tuple
+from cells import CELLS, CELL_INDEX, NUM_CELLS, NEIGHBOURS, OFF_BOARD
+from moves import SINGLE, INLINE, SIDE_STEP, PUSH, encode_move, decode_move, compact_move_cells
+from enums import Marble
+from transposition_tables import ZOBRIST_KEYS
+
+FULL_MASK = (1 << NUM_CELLS) - 1
+SIDE_STEP_AXES = (0, 1, 2)  # One direction per line axis, so every group of marbles is only seen once
+
+
+def _build_shift_table() -> List[Tuple[Tuple[int, int], ...]]:
+    """
+    Precomputes, for every direction, the (delta, mask) pairs needed to move a set of cells one step.
+
+    Rows have different lengths, so the index offset to a neighbour depends on the row. Cells are grouped by that
+    offset; the mask of each group only contains cells whose neighbour is still on the board.
+    """
+    table = []
+    for direction in range(6):
+        groups: Dict[int, int] = {}
+        for index in range(NUM_CELLS):
+            neighbour = NEIGHBOURS[index * 6 + direction]
+            if neighbour != OFF_BOARD:
+                delta = neighbour - index
+                groups[delta] = groups.get(delta, 0) | (1 << index)
+        table.append(tuple(groups.items()))
+    return table
+
+_SHIFTS = _build_shift_table()
+
+
+def shift(bits: int, direction: int) -> int:
+    """
+    Moves every set cell one step in the given direction. Cells that would leave the board are dropped.
+
+    :param bits: a set of cells as a bitboard
+    :param direction: the direction index into DIRECTION_SYMBOLS
+    :return: the shifted set of cells
+    """
+    result = 0
+    for delta, mask in _SHIFTS[direction]:
+        if delta > 0:
+            result |= (bits & mask) << delta
+        else:
+            result |= (bits & mask) >> -delta
+    return result
+
+
+# Cells whose neighbour in each direction is off the board. A pushed marble on one of these cells leaves the board.
+EDGE_MASKS = [sum(1 << cell for cell in range(NUM_CELLS) if NEIGHBOURS[cell * 6 + d] == OFF_BOARD) for d in range(6)]
+
+
+def _build_chunk_table() -> List[List[Tuple[Tuple[int, int, int], ...]]]:
+    """Precomputes the cells held by every byte value at every byte offset of a bitboard."""
+    return [
+        [tuple(CELLS[offset * 8 + i] for i in range(8) if value >> i & 1 and offset * 8 + i < NUM_CELLS)
+         for value in range(256)]
+        for offset in range((NUM_CELLS + 7) // 8)
+    ]
+
+_CHUNK_CELLS = _build_chunk_table()
+
+
+def cells_of(bits: int) -> Tuple[Tuple[int, int, int], ...]:
+    """Returns the (q, r, s) cells set in a bitboard, lowest cell index first."""
+    cells = ()
+    offset = 0
+    while bits:
+        if bits & 0xFF:
+            cells += _CHUNK_CELLS[offset][bits & 0xFF]
+        bits >>= 8
+        offset += 1
+    return cells
+
+
+def iter_bits(bits: int):
+    """Yields each set bit of a bitboard as its own single-bit integer, lowest cell index first."""
+    while bits:
+        low = bits & -bits
+        yield low
+        bits ^= low
+
+
+def _bits_of(cells: List[Tuple[int, int, int]]) -> int:
+    """Returns the bitboard of a list of cells, or -1 if any cell is off the board."""
+    bits = 0
+    for cell in cells:
+        if cell not in CELL_INDEX:
+            return -1
+        bits |= 1 << CELL_INDEX[cell]
+    return bits
+
+
+def _build_move_deltas() -> Dict[int, Tuple[int, int, int]]:
+    """
+    Precomputes, for every compact move that fits on the board, the cells that change when it is made.
+    Applying or undoing a move is then an XOR with these bitboards.
+
+    :return: compact move -> (changed cells of the moving player, changed cells of the opponent,
+             pushed marbles that leave the board)
+    """
+    codes = []
+    for anchor in range(NUM_CELLS):
+        for d in range(6):
+            back = (d + 3) % 6
+            codes.append(encode_move(anchor, back, 1, d, SINGLE))
+            for size in (2, 3):
+                codes.append(encode_move(anchor, back, size, d, INLINE))
+                codes.extend(encode_move(anchor, back, size, d, PUSH, pushed) for pushed in range(1, size))
+        for axis in SIDE_STEP_AXES:
+            for size in (2, 3):
+                codes.extend(encode_move(anchor, axis, size, d, SIDE_STEP) for d in range(6) if d % 3 != axis)
+
+    deltas = {}
+    for code in codes:
+        direction, move_type = decode_move(code)[3:5]
+        moved, pushed = compact_move_cells(code)
+        marbles, pushed_bits = _bits_of(moved), _bits_of(pushed)
+        if marbles < 0 or pushed_bits < 0:
+            continue
+        own_delta = marbles ^ shift(marbles, direction)
+        if move_type != PUSH and shift(marbles, direction).bit_count() < len(moved):  # Would move off the board
+            continue
+        deltas[code] = (own_delta, pushed_bits ^ shift(pushed_bits, direction), pushed_bits & EDGE_MASKS[direction])
+    return deltas
+
+MOVE_DELTAS = _build_move_deltas()
+
+
+def _build_move_requirements() -> Dict[int, Tuple[int, int, int]]:
+    """
+    Precomputes, for every compact move in MOVE_DELTAS, the cells the move needs so its legality is three mask tests.
+
+    :return: compact move -> (cells that must hold the player's marbles, cells that must hold opponent marbles,
+             cells that must be empty)
+    """
+    requirements = {}
+    for code in MOVE_DELTAS:
+        direction = decode_move(code)[3]
+        moved, pushed = compact_move_cells(code)
+        marbles, pushed_bits = _bits_of(moved), _bits_of(pushed)
+        line = marbles | pushed_bits
+        requirements[code] = (marbles, pushed_bits, shift(line, direction) & ~line)
+    return requirements
+
+MOVE_REQUIREMENTS = _build_move_requirements()
+
+# Running sums kept by every BitBoard for the evaluation, packed into one integer of FEATURE_BITS wide fields: for each
+# colour the sum of |q| + |r| + |s| (twice the distance to the centre), the sum of q and the sum of r. The q and r sums
+# are stored offset by FEATURE_BIAS so every field stays non-negative, which lets a move update all six sums with a
+# single addition of its packed differences
+FEATURE_BITS = 12
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+FEATURE_BIAS = 1 << (FEATURE_BITS - 1)
+BLACK_FEATURES_SHIFT, WHITE_FEATURES_SHIFT = 0, 3 * FEATURE_BITS
+EMPTY_FEATURES = sum(FEATURE_BIAS << (colour_shift + field * FEATURE_BITS)
+                     for colour_shift in (BLACK_FEATURES_SHIFT, WHITE_FEATURES_SHIFT) for field in (1, 2))
+
+
+def _build_cell_features() -> Dict[str, List[int]]:
+    """Precomputes the packed features of a single marble of each colour on every cell."""
+    return {
+        colour: [(abs(q) + abs(r) + abs(s) + (q << FEATURE_BITS) + (r << 2 * FEATURE_BITS)) << colour_shift
+                 for q, r, s in CELLS]
+        for colour, colour_shift in ((Marble.BLACK.value, BLACK_FEATURES_SHIFT), (Marble.WHITE.value, WHITE_FEATURES_SHIFT))
+    }
+
+CELL_FEATURES = _build_cell_features()
+
+
+def board_features(black: int, white: int) -> int:
+    """Sums the packed features of every marble on a board, see CELL_FEATURES."""
+    features = EMPTY_FEATURES
+    for colour, bits in ((Marble.BLACK.value, black), (Marble.WHITE.value, white)):
+        cell_features = CELL_FEATURES[colour]
+        while bits:
+            low = bits & -bits
+            features += cell_features[low.bit_length() - 1]
+            bits ^= low
+    return features
+
+
+def _build_move_feature_deltas() -> Dict[int, Tuple[int, int]]:
+    """
+    Precomputes, for every compact move in MOVE_DELTAS, the change of the packed features when it is made.
+
+    :return: compact move -> (the change when black makes the move, the change when white makes it)
+    """
+    black, white = Marble.BLACK.value, Marble.WHITE.value
+    deltas = {}
+    for code in MOVE_DELTAS:
+        direction = decode_move(code)[3]
+        moved, pushed = compact_move_cells(code)
+        moved = [CELL_INDEX[cell] for cell in moved]
+        pushed = [CELL_INDEX[cell] for cell in pushed]
+        changes = []
+        for own, opponent in ((black, white), (white, black)):
+            change = 0
+            for cells, colour in ((moved, own), (pushed, opponent)):
+                for cell in cells:
+                    change -= CELL_FEATURES[colour][cell]
+                    destination = NEIGHBOURS[cell * 6 + direction]
+                    if destination != OFF_BOARD: # A pushed marble can leave the board
+                        change += CELL_FEATURES[colour][destination]
+            changes.append(change)
+        deltas[code] = tuple(changes)
+    return deltas
+
+MOVE_FEATURE_DELTAS = _build_move_feature_deltas()
+
+
+def zobrist_hash(bits: int, colour: str) -> int:
+    """
+    XORs together the Zobrist keys of the given colour for every set cell.
+
+    :param bits: the cells as a bitboard
+    :param colour: the colour of the marbles on those cells
+    :return: the combined keys
+    """
+    keys = ZOBRIST_KEYS[colour]
+    hash_value = 0
+    while bits:
+        low = bits & -bits
+        hash_value ^= keys[low.bit_length() - 1]
+        bits ^= low
+    return hash_value
+
+
+class BitBoard(Mapping):
+    """
+    A board stored as one bitboard per colour.
+
+    The board carries its Zobrist hash (without the player to move), the number of marbles of each colour and the packed
+    running sums used by the evaluation (see CELL_FEATURES), which make_move and unmake_move keep up to date so scoring,
+    the terminal test and the evaluation never have to count or scan the marbles.
+
+    The class is also a read-only mapping of (q, r, s) -> colour, so functions written against the
+    marble_positions dictionary (heuristics, scoring) can read it directly.
+    """
+    __slots__ = ("black", "white", "hash", "black_count", "white_count", "features")
+
+    def __init__(self, black: int = 0, white: int = 0):
+        self.black = black
+        self.white = white
+        self.hash = zobrist_hash(black, Marble.BLACK.value) ^ zobrist_hash(white, Marble.WHITE.value)
+        self.black_count = black.bit_count()
+        self.white_count = white.bit_count()
+        self.features = board_features(black, white)
+
+    def feature_sums(self, colour: str) -> Tuple[int, int, int]:
+        """
+        Returns the running sums of a colour's marbles: the sum of |q| + |r| + |s|, the sum of q and the sum of r.
+        """
+        shift = BLACK_FEATURES_SHIFT if colour == Marble.BLACK.value else WHITE_FEATURES_SHIFT
+        features = self.features >> shift
+        return (features & FEATURE_MASK,
+                (features >> FEATURE_BITS & FEATURE_MASK) - FEATURE_BIAS,
+                (features >> 2 * FEATURE_BITS & FEATURE_MASK) - FEATURE_BIAS)
+
+    @staticmethod
+    def from_dict(marble_positions: Dict[Tuple[int, int, int], str]) -> 'BitBoard':
+        """
+        Creates a BitBoard from a marble positions dictionary.
+
+        :param marble_positions: a dictionary of (q, r, s) -> 'b' or 'w'
+        :return: the equivalent BitBoard
+        """
+        black = white = 0
+        for pos, colour in marble_positions.items():
+            if colour == Marble.BLACK.value:
+                black |= 1 << CELL_INDEX[pos]
+            else:
+                white |= 1 << CELL_INDEX[pos]
+        return BitBoard(black, white)
+
+    def to_dict(self) -> Dict[Tuple[int, int, int], str]:
+        """Returns the board as a marble positions dictionary."""
+        return dict(self.items())
+
+    def copy(self) -> 'BitBoard':
+        return BitBoard(self.black, self.white)
+
+    def marbles(self, colour: str) -> int:
+        """Returns the bitboard of the given colour."""
+        return self.black if colour == Marble.BLACK.value else self.white
+
+    # Mapping interface, (q, r, s) -> colour
+    def __getitem__(self, pos: Tuple[int, int, int]) -> str:
+        index = CELL_INDEX.get(pos)
+        if index is not None:
+            if self.black >> index & 1:
+                return Marble.BLACK.value
+            if self.white >> index & 1:
+                return Marble.WHITE.value
+        raise KeyError(pos)
+
+    def get(self, pos, default=None):
+        try:
+            return self[pos]
+        except KeyError:
+            return default
+
+    def __contains__(self, pos) -> bool:
+        index = CELL_INDEX.get(pos)
+        return index is not None and (self.black | self.white) >> index & 1 == 1
+
+    def __iter__(self):
+        return iter(cells_of(self.black | self.white))
+
+    def __len__(self) -> int:
+        return self.black_count + self.white_count
+
+    def items(self) -> List[Tuple[Tuple[int, int, int], str]]:
+        black, white = Marble.BLACK.value, Marble.WHITE.value
+        return [(cell, black) for cell in cells_of(self.black)] + [(cell, white) for cell in cells_of(self.white)]
+
+    def values(self) -> List[str]:
+        return [Marble.BLACK.value] * self.black_count + [Marble.WHITE.value] * self.white_count
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, BitBoard):
+            return self.black == other.black and self.white == other.white
+        return super().__eq__(other)
+
+    def __hash__(self) -> int:
+        return hash((self.black, self.white))
+
+
+def _own_and_opponent(player: str, board: BitBoard) -> Tuple[int, int]:
+    """Returns the bitboards of the player and of the opponent."""
+    if player == Marble.BLACK.value:
+        return board.black, board.white
+    return board.white, board.black
+
+
+def generate_push_moves(player: str, board: BitBoard) -> List[int]:
+    """
+    Generates the pushes of one or two opponent marbles by a line of two or three friendly marbles.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :return: a list of compact push moves, the front marble of the pushing line is the anchor
+    """
+    own, opp = _own_and_opponent(player, board)
+    occupied = own | opp
+
+    moves = []
+    for d in range(6):
+        back = (d + 3) % 6
+        # Cells whose neighbour in direction d is not occupied (either empty or off the board)
+        to_free = ~shift(occupied, back)
+
+        # Fronts of friendly lines of two and three marbles facing direction d
+        front2 = own & shift(own, d)
+        front3 = front2 & shift(front2, d)
+
+        # Pushes of one opponent marble by two or three marbles
+        ahead2 = shift(front2, d) & opp
+        base = encode_move(0, back, 2, d, PUSH, 1)
+        for bit in iter_bits(ahead2 & to_free):
+            moves.append(base | NEIGHBOURS[(bit.bit_length() - 1) * 6 + back])
+        ahead3 = shift(front3, d) & opp
+        base = encode_move(0, back, 3, d, PUSH, 1)
+        for bit in iter_bits(ahead3 & to_free):
+            moves.append(base | NEIGHBOURS[(bit.bit_length() - 1) * 6 + back])
+
+        # Pushes of two opponent marbles by three marbles
+        base = encode_move(0, back, 3, d, PUSH, 2)
+        for bit in iter_bits(shift(ahead3, d) & opp & to_free):
+            moves.append(base | NEIGHBOURS[NEIGHBOURS[(bit.bit_length() - 1) * 6 + back] * 6 + back])
+
+    return moves
+
+
+def generate_inline_moves(player: str, board: BitBoard) -> List[int]:
+    """
+    Generates the moves of single marbles and of lines of two or three marbles along their own axis into an empty cell.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :return: a list of compact single and inline moves, the front marble is the anchor
+    """
+    own, opp = _own_and_opponent(player, board)
+    empty = FULL_MASK & ~(own | opp)
+
+    moves = []
+    for d in range(6):
+        back = (d + 3) % 6
+        # Cells whose neighbour in direction d is empty
+        to_empty = shift(empty, back)
+
+        # Single marbles
+        base = encode_move(0, back, 1, d, SINGLE)
+        for bit in iter_bits(own & to_empty):
+            moves.append(base | bit.bit_length() - 1)
+
+        # Fronts of friendly lines of two and three marbles facing direction d
+        front2 = own & shift(own, d)
+        front3 = front2 & shift(front2, d)
+
+        base = encode_move(0, back, 2, d, INLINE)
+        for bit in iter_bits(front2 & to_empty):
+            moves.append(base | bit.bit_length() - 1)
+        base = encode_move(0, back, 3, d, INLINE)
+        for bit in iter_bits(front3 & to_empty):
+            moves.append(base | bit.bit_length() - 1)
+
+    return moves
+
+
+def generate_side_step_moves(player: str, board: BitBoard) -> List[int]:
+    """
+    Generates the side-steps of lines of two and three marbles, one axis per line so each group is only generated once.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :return: a list of compact side-step moves, the marble at the start of the line is the anchor
+    """
+    own, opp = _own_and_opponent(player, board)
+    empty = FULL_MASK & ~(own | opp)
+
+    moves = []
+    for axis in SIDE_STEP_AXES:
+        axis_back = axis + 3
+        tail2 = own & shift(own, axis_back)
+        tail3 = tail2 & shift(tail2, axis_back)
+        for d in range(6):
+            if d % 3 == axis:  # Moving along the line is an inline move
+                continue
+            to_empty = shift(empty, (d + 3) % 6)
+            pair_free = to_empty & shift(to_empty, axis_back)
+            base = encode_move(0, axis, 2, d, SIDE_STEP)
+            for bit in iter_bits(tail2 & pair_free):
+                moves.append(base | bit.bit_length() - 1)
+            base = encode_move(0, axis, 3, d, SIDE_STEP)
+            for bit in iter_bits(tail3 & pair_free & shift(pair_free, axis_back)):
+                moves.append(base | bit.bit_length() - 1)
+
+    return moves
+
+
+def generate_bitboard_moves(player: str, board: BitBoard) -> List[int]:
+    """
+    Generates all legal moves for the player using shift-and-mask operations on whole sets of marbles.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :return: a list of compact moves (see moves.encode_move): pushes, singles and inline moves, then side-steps
+    """
+    return (generate_push_moves(player, board)
+            + generate_inline_moves(player, board)
+            + generate_side_step_moves(player, board))
+
+
+def is_legal_move(player: str, board: BitBoard, move: int) -> bool:
+    """
+    Checks whether a compact move can be made on the board, e.g. a move remembered from another position.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :param move: the compact move to check
+    :return: True if the move is legal for the player, else False
+    """
+    requirements = MOVE_REQUIREMENTS.get(move)
+    if requirements is None:
+        return False
+    own_mask, opp_mask, free_mask = requirements
+    own, opp = _own_and_opponent(player, board)
+    return own & own_mask == own_mask and opp & opp_mask == opp_mask and not (own | opp) & free_mask
@@ -2,7 +2,7 @@
 import os
 import sys
 from enum import Enum, auto
-from typing import Tuple, Set, List
+from typing import Dict, Tuple, Set, List
 from enums import Marble
 import copy
 from file_paths import FilePaths
@@ -292,10 +292,26 @@ class Board:
         Given an input string in the format: `C5b,A2w,...`, parses every line, updating it's marble positions dictionary and empty positions
         """
         self.reset_board()
+        self.marble_positions.update(Board.parse_board_str(board_str))
+        self.set_empty_positions()
+
+    @staticmethod
+    def parse_board_str(board_str: str) -> Dict[Tuple[int, int, int], str]:
+        """
+        Parses a board string in the format: `C5b,A2w,...` into a marble positions dictionary.
+
+        :raises ValueError: if a marble notation cannot be parsed
+        """
+        marble_positions = {}
         for notation in board_str.split(","):
+            notation = notation.strip()
+            if len(notation) < 3:
+                raise ValueError(f"Invalid marble notation: {notation!r}")
             q, r, s, colour = Board.convert_marble_notation(notation)
-            self.marble_positions[(q, r, s)] = colour
-        self.set_empty_positions()
+            if colour not in (Marble.BLACK.value, Marble.WHITE.value) or max(abs(q), abs(r), abs(s)) > 4:
+                raise ValueError(f"Invalid marble notation: {notation!r}")
+            marble_positions[(q, r, s)] = colour
+        return marble_positions
 
 
     def print_board(self):
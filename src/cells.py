@@ -0,0 +1,63 @@
+"""Houses the fixed numbering of the 61 board cells and per-cell tables shared by move generation and heuristics."""
+from typing import Dict, List, Tuple
+
+# Cells are numbered row by row from row I (r=-4) down to row A (r=+4), left to right (ascending q) within a row.
+CELLS: List[Tuple[int, int, int]] = [
+    (q, r, -q - r)
+    for r in range(-4, 5)
+    for q in range(-4, 5)
+    if abs(q + r) <= 4
+]
+
+NUM_CELLS = len(CELLS)  # 61 on a standard board
+
+CELL_INDEX: Dict[Tuple[int, int, int], int] = {cell: index for index, cell in enumerate(CELLS)}
+
+# Unit steps in the same order as moves.DIRECTIONS: →, ↗, ↖, ←, ↙, ↘. The opposite of direction d is (d + 3) % 6
+DIRECTION_STEPS: List[Tuple[int, int, int]] = [(1, 0, -1), (1, -1, 0), (0, -1, 1), (-1, 0, 1), (-1, 1, 0), (0, 1, -1)]
+
+OFF_BOARD = NUM_CELLS  # Sentinel index for a neighbour that is off the board
+
+
+def _build_neighbours() -> List[int]:
+    """Returns the flat neighbour table: index cell * 6 + direction -> neighbouring cell index or OFF_BOARD."""
+    return [
+        CELL_INDEX.get((q + dq, r + dr, s + ds), OFF_BOARD)
+        for q, r, s in CELLS
+        for dq, dr, ds in DIRECTION_STEPS
+    ]
+
+NEIGHBOURS: List[int] = _build_neighbours()
+
+
+def _build_rays() -> List[Tuple[int, ...]]:
+    """Returns the flat ray table: index cell * 6 + direction -> the next 1-3 cells in that direction, nearest first."""
+    rays = []
+    for cell in range(NUM_CELLS):
+        for direction in range(6):
+            ray = []
+            current = NEIGHBOURS[cell * 6 + direction]
+            while current != OFF_BOARD and len(ray) < 3:
+                ray.append(current)
+                current = NEIGHBOURS[current * 6 + direction]
+            rays.append(tuple(ray))
+    return rays
+
+RAYS: List[Tuple[int, ...]] = _build_rays()
+
+# Per cell: the on-board neighbours, as cell indices and as (q, r, s) positions for looking up a marble dictionary
+ADJACENT: List[Tuple[int, ...]] = [
+    tuple(n for n in NEIGHBOURS[cell * 6:cell * 6 + 6] if n != OFF_BOARD) for cell in range(NUM_CELLS)
+]
+ADJACENT_POSITIONS: List[Tuple[Tuple[int, int, int], ...]] = [
+    tuple(CELLS[n] for n in neighbours) for neighbours in ADJACENT
+]
+ADJACENT_MASKS: List[int] = [sum(1 << n for n in neighbours) for neighbours in ADJACENT]  # As a bitboard
+
+# Hex distance of each cell to the centre (0, 0, 0), and the number of steps to the outer ring (0 on the edge)
+CENTRE_DISTANCE: List[int] = [max(abs(q), abs(r), abs(s)) for q, r, s in CELLS]
+EDGE_DISTANCE: List[int] = [4 - distance for distance in CENTRE_DISTANCE]
+
+# Hex distance of each cell to the nearest of the three lines through the centre, which the edge safety heuristic
+# scales into the base safety of a marble
+AXIS_DISTANCE: List[int] = [min(abs(q), abs(r), abs(s)) for q, r, s in CELLS]
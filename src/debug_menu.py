@@ -5,8 +5,8 @@ from typing import List, Set, Tuple, Dict, Optional, Any
 from board import Board, BoardConfiguration
 from state_space import GameState
 from minmax_agent import MinimaxAgent, AgentConfiguration
-from enums import Marble, GameMode
-from heuristic import c_heuristic, b_heuristic, heuristic, yz_heuristic
+from enums import Marble, GameMode, SearchBackend
+from heuristic import c_heuristic, b_heuristic, heuristic, yz_heuristic, incremental_heuristic
 import json
 import state_space
 from file_paths import FilePaths
@@ -32,7 +32,8 @@ class DebugMenu:
                 "(1) Run Model\n"
                 "(2) Generate boards from .input file(s)\n"
                 "(3) Check if .board files are equal\n"
-                "(4) Exit"
+                "(4) Benchmark the parallel search\n"
+                "(5) Exit"
             )
             user_input = input("Enter: ").strip(",.?! ")
             match user_input:
@@ -43,6 +44,8 @@ class DebugMenu:
                 case "3":
                     DebugMenu._handle_board_files()
                 case "4":
+                    DebugMenu._benchmark_parallel_search()
+                case "5":
                     print("Exiting program...")
                     break
                 case _:
@@ -95,6 +98,42 @@ class DebugMenu:
         agent.run_game()
 
     
+    @staticmethod
+    def _benchmark_parallel_search():
+        """
+        Times a fixed depth search of a board with each parallel search backend and 1, 2, 4 and 8 workers, printing
+        the speedup of every run over the serial search.
+        """
+        board = DebugMenu._get_board_configuration()
+        depth = DebugMenu._get_depth()
+        if depth == -1:
+            print("The benchmark needs a fixed depth. Returning to menu")
+            return
+        agent_heuristic = DebugMenu._get_heuristic()
+        weights = DebugMenu._get_weights()
+        player_configuration = AgentConfiguration(Marble.BLACK, 1, 1, agent_heuristic, weights)
+        opponent_configuration = AgentConfiguration(Marble.WHITE, 1, 1, agent_heuristic, weights)
+
+        results = []
+        for backend in SearchBackend:
+            for workers in (1, 2, 4, 8):
+                if workers == 1 and results: # The serial search is the same for both backends
+                    continue
+                agent = MinimaxAgent(board, player_configuration, opponent_configuration, GameMode.RANDOM, depth,
+                                     search_workers=workers, search_backend=backend)
+                start = time.perf_counter()
+                agent.iterative_deepening_search(None, True, agent_heuristic, weights)
+                elapsed = time.perf_counter() - start
+                agent.close_search()
+                results.append((backend.value if workers > 1 else "serial", workers, elapsed, agent.nodes))
+
+        serial_time = results[0][2]
+        print(f"\nDepth {depth}, {os.cpu_count()} CPUs")
+        print(f"{'Backend':<12}{'Workers':>8}{'Seconds':>10}{'Nodes':>12}{'Speedup':>9}")
+        for backend, workers, elapsed, nodes in results:
+            print(f"{backend:<12}{workers:>8}{elapsed:>10.2f}{nodes:>12}{serial_time / elapsed:>9.2f}")
+
+
     @staticmethod
     def _get_board_configuration() -> Board:
         """
@@ -352,7 +391,7 @@ class DebugMenu:
         """
         while True:
             print(f"\nEnter player {player_num}'s heuristic:\n")
-            print(f"(1) Main heuristic\n(2) c_heuristic\n(3) b_heuristic\n(4) yz_heuristic\n")
+            print(f"(1) Main heuristic\n(2) c_heuristic\n(3) b_heuristic\n(4) yz_heuristic\n(5) incremental_heuristic\n")
             heuristic_input = input("Enter your choice: ").strip()
             if heuristic_input == "1":
                 return heuristic
@@ -362,6 +401,8 @@ class DebugMenu:
                 return b_heuristic
             elif heuristic_input == "4":
                 return yz_heuristic
+            elif heuristic_input == "5":
+                return incremental_heuristic
             else:
                 print("Invalid selection. Please try again.")
 
@@ -628,6 +669,7 @@ class DebugMenu:
             player1_weights = DebugMenu._get_weights()
             player1_configuration = DebugMenu._create_configuration(data, 1, player1_heuristic, player1_weights)
             player2_configuration = DebugMenu._create_configuration(data, 2)
+            search_settings = DebugMenu._get_search_settings(data)
             depth = DebugMenu._get_depth()
 
             if board is None:
@@ -639,12 +681,18 @@ class DebugMenu:
             if player2_configuration is None:
                 return None
 
+            if search_settings is None:
+                return None
+            search_workers, search_backend = search_settings
+
             return MinimaxAgent(
                 board,
                 player1_configuration,
                 player2_configuration,
                 GameMode.HUMAN, # Application will always be agent vs Human
-                depth
+                depth,
+                search_workers=search_workers,
+                search_backend=search_backend
             )
 
 
@@ -678,6 +726,32 @@ class DebugMenu:
 
 
 
+    @staticmethod
+    def _get_search_settings(file) -> Optional[Tuple[int, SearchBackend]]:
+        """
+        Returns the number of search processes and the way the search is split across them, given a file input. Both
+        are optional, a file without them searches serially.
+
+        :returns: the number of search workers and the search backend if no error, else None
+        """
+
+        search_workers = file.get("search_workers", 1)
+        if isinstance(search_workers, bool) or not isinstance(search_workers, int) or search_workers < 1:
+            print(f"Error reading attribute `search_workers` from {FilePaths.CONFIGURATION_FILE.value}. Expected a positive integer, got {search_workers!r}")
+            return None
+
+        backend = file.get("search_backend", SearchBackend.ROOT_SPLIT.value)
+        try:
+            search_backend = SearchBackend(backend)
+        except ValueError:
+            backends = ", ".join(member.value for member in SearchBackend)
+            print(f"Error reading attribute `search_backend` from {FilePaths.CONFIGURATION_FILE.value}. Cannot parse {backend!r}, expected one of {backends}")
+            return None
+
+        return search_workers, search_backend
+
+
+
     @staticmethod
     def _create_configuration(file, player_number:int, heuristic=None, heuristic_weights=None) -> Optional[AgentConfiguration]:
         """
@@ -13,3 +13,8 @@ class GameMode(Enum):
     RANDOM = auto()
     DIFF_HEURISTIC = auto()
     SAME_HEURISTIC = auto()
+
+class SearchBackend(Enum):
+    """Represents the ways the search is split across processes when it has more than one worker."""
+    ROOT_SPLIT = "root_split"
+    LAZY_SMP = "lazy_smp"
@@ -3,8 +3,8 @@ from contextlib import AbstractAsyncContextManager
 import os
 import sys
 from enum import Enum
-import time
-from typing import Tuple
+from typing import Optional, Tuple
+from file_watcher import FileWatcher, modified_time
 
 class FilePaths(Enum):
     """Represents the file paths for the running program."""
@@ -37,34 +37,43 @@ def write_to_output_game_file(file_path: FilePaths, data: str):
     Writes the game state to an output .txt file. Creates the file if it doesn't exist. Writes only to the first line
     in the file. Overwrites any data.
 
+    The data is written to a temporary file that is then renamed over the output file, so a reader never sees a half
+    written file.
+
     This might be used to write the ai's generated move, or current board state in the format C5b, ...
     """
-    with open(file_path.value, "w", encoding="utf-8") as file:
+    temporary_path = f"{file_path.value}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
         file.write(data)
+    try:
+        os.replace(temporary_path, file_path.value)
+    except PermissionError: # Windows refuses to replace a file another process has open
+        os.remove(temporary_path)
+        with open(file_path.value, "w", encoding="utf-8") as file:
+            file.write(data)
 
 
-def read_from_output_game_file(file_path: FilePaths, last_modified_time) -> Tuple[str, float]:
+def read_from_output_game_file(file_path: FilePaths, last_modified_time: Optional[int]) -> Tuple[str, int]:
     """
     Reads a game state from an output .txt file. Reads the single first line.
 
+    Blocks until the file has been written completely since it was last read, see FileWatcher.
+
     This might be used to read the output board configuration from the GUI, in the format C5b, ...
 
     :param file_path: the path of the file to read from as an enum
-    :param last_modified_time: the last time the file has been read from
-    :returns: the data in the file as a str and the timestamp from which it was modified
+    :param last_modified_time: the modification time in nanoseconds of the version already seen, taken when the game
+                               started or when the agent last wrote its move. None if the file did not exist then,
+                               any version counts as new
+    :returns: the data in the file as a str and the modification time of the version read
     """
-    # Wait for the file to exist
-    while not os.path.exists(file_path.value):
-        print(f"File {file_path.value} not found. Waiting...")
-        time.sleep(0.1)
-
-    
-    input("<Enter> to read opponent move")
-    with open(file_path.value, "r", encoding="utf-8") as file:
-        board_str = file.readline().strip()
-
-        print(f"File modified! New board state: {board_str}")
-            
-        return board_str, last_modified_time  # Reads, updates, and keeps running
-
-        time.sleep(0.1)
+    with FileWatcher(file_path.value) as watcher:
+        while True:
+            last_modified_time = watcher.wait_for_change(last_modified_time)
+            with open(file_path.value, "r", encoding="utf-8") as file:
+                board_str = file.readline().strip()
+            if modified_time(file_path.value) == last_modified_time: # Not rewritten while it was read
+                break
+
+    print(f"File modified! New board state: {board_str}")
+    return board_str, last_modified_time
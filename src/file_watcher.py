@@ -0,0 +1,120 @@
+"""Houses the watcher that waits for the GUI to write a file, using inotify where available and stat polling if not."""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Optional
+
+POLL_INTERVAL = 0.002 # Seconds between stat calls when inotify is not available
+_INOTIFY_EVENT = struct.Struct('iIII') # wd, mask, cookie, name length, followed by the name
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+def _load_inotify():
+    """Returns libc if it provides inotify, else None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_LIBC = _load_inotify()
+
+
+def modified_time(path: str) -> Optional[int]:
+    """Returns the modification time of a file in nanoseconds, None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class FileWatcher:
+    """
+    Waits for a file to be written completely.
+
+    With inotify, the watcher sleeps until a writer closes the file or renames a finished file over it. Without it,
+    the file is polled every POLL_INTERVAL seconds and counts as written once its modification time and size have
+    stayed the same for one interval.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the file to watch. Its directory must exist, the file itself need not
+        """
+        self.path = path
+        self.directory, self.name = os.path.split(os.path.abspath(path))
+        self.fd = -1
+        if _LIBC is not None:
+            fd = _LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _LIBC.inotify_add_watch(fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def wait_for_change(self, last_modified_time: Optional[int]) -> int:
+        """
+        Blocks until the file has been written completely since the given modification time.
+
+        :param last_modified_time: the modification time in nanoseconds of the version already read, None for any
+        :return: the modification time of the new version
+        """
+        # A version written before the watch started may still be being written, it is polled until it settles
+        current = modified_time(self.path)
+        if current is not None and current != last_modified_time and self._settled(current):
+            return current
+        while True:
+            if self.fd >= 0:
+                self._wait_for_event()
+            else:
+                time.sleep(POLL_INTERVAL)
+            current = modified_time(self.path)
+            if current is not None and current != last_modified_time and (self.fd >= 0 or self._settled(current)):
+                return current
+
+    def _settled(self, modified: int) -> bool:
+        """Returns True if the file is unchanged after one poll interval, as a writer would have changed it by then."""
+        try:
+            size = os.stat(self.path).st_size
+            time.sleep(POLL_INTERVAL)
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_mtime_ns == modified and stat.st_size == size
+
+    def _wait_for_event(self) -> None:
+        """Sleeps until a writer has closed the file or renamed a finished file over it."""
+        while True:
+            select.select([self.fd], [], [])
+            try:
+                events = os.read(self.fd, 4096)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(events):
+                _, mask, _, length = _INOTIFY_EVENT.unpack_from(events, offset)
+                offset += _INOTIFY_EVENT.size
+                name = events[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name == os.fsencode(self.name) and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    return
@@ -1,8 +1,11 @@
 import math
-from typing import List
+from typing import Callable, List, Sequence
 import numpy as np
 from typing import Dict, Tuple
 from moves import DIRECTIONS
+from cells import CELLS, CELL_INDEX, NEIGHBOURS, NUM_CELLS, ADJACENT_MASKS, ADJACENT_POSITIONS, CENTRE_DISTANCE, \
+    EDGE_DISTANCE, AXIS_DISTANCE
+from bitboard import BitBoard, cells_of, iter_bits, shift, _bits_of
 from state_space import GameState, get_score
 from enums import Marble
 from itertools import combinations
@@ -53,43 +56,71 @@ def heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: f
             + wmc * coherence_val
             + wsc * score_diff)
 
-# def heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: float, wmc: float, wsc: float) -> float:
-#     """ add the score diff to the heuristic """
-#     return (wdc*distance_to_center(player_colour, board)
-#             + wmc*marbles_coherence(player_colour, board)
-#             + wsc*score_difference(player_colour, board))
+def incremental_heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: float, wmc: float,
+                          wsc: float) -> float:
+    """
+    The main heuristic, computed from the running sums a BitBoard keeps up to date as moves are made and unmade.
 
-def c_heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: float, wmc: float, wt: float) -> float:
+    The distance to center and score difference take constant time, and the coherence takes one pass over the marbles
+    with the means read from the sums. The operations are the same as the main heuristic's, in the same order, so the
+    value is identical bit for bit. Boards that are not BitBoards are passed to the main heuristic.
+
+    :param board: a BitBoard, or a dictionary of cube coordinates to marble colors
+    :param wdc: weight for distance to center
+    :param wmc: weight for marble coherence
+    :param wsc: weight for score difference
+    :return: heuristic value
     """
-    Implementation for a heuristic function that uses the following evaluation functions:
-    - Distance to centre
-    - Marble coherence
-    - Distance to center
+    if not isinstance(board, BitBoard):
+        return heuristic(player_colour, board, wdc, wmc, wsc)
+    count_b, count_w = board.black_count, board.white_count
+    distance_sum_b, q_sum_b, r_sum_b = board.feature_sums(Marble.BLACK.value)
+    distance_sum_w, q_sum_w, r_sum_w = board.feature_sums(Marble.WHITE.value)
+
+    # The sums hold twice the distances, halving them is exact
+    distance_to_center_val = distance_sum_w / 2 / count_w - distance_sum_b / 2 / count_b
+
+    coherence_val_b = _coherence_sum(board.black, q_sum_b / count_b, r_sum_b / count_b) / count_b
+    coherence_val_w = _coherence_sum(board.white, q_sum_w / count_w, r_sum_w / count_w) / count_w
+    coherence_val = coherence_val_w - coherence_val_b
+
+    score_diff = count_b - count_w
+
+    return (wdc * distance_to_center_val
+            + wmc * coherence_val
+            + wsc * score_diff)
+
+incremental_heuristic.takes_bitboard = True # The search passes its BitBoard instead of a dictionary
+
+def heuristic_delta_margin(wdc: float, wmc: float, wsc: float) -> float:
     """
-    return wdc*distance_to_center(player_colour, board) + wmc*marbles_coherence(player_colour, board) + wt*triangle_formation(player_colour, board)
+    Bounds how much a push that does not push a marble off can change the main heuristic, for the quiescence search's
+    delta pruning.
+
+    Such a push moves a few marbles of each side one cell and keeps the marble counts. Each moved marble's distance to
+    the center changes by at most 1, so each side's average does too. The mean position moves by at most the fraction
+    of marbles moved, so each side's average coherence changes by at most 2. The score difference does not change.
 
-def b_heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: int, wmc: int, wes: int) -> float:
+    :param wdc: weight for distance to center
+    :param wmc: weight for marble coherence
+    :param wsc: weight for score difference
+    :return: the largest change in the heuristic value
     """
-    Implementation for a heuristic function that uses the following evaluation functions:
-    - Distance to centre
-    - Marble coherence
-    - Edge safety
+    return 2 * abs(wdc) + 4 * abs(wmc)
 
-    :param game_state:
-    :param wdc: weight for the distance to centre evaluation
-    :param wmc: weight for the marble coherence evaluation
-    :param wes: weight for the edge safety evaluation
+def _coherence_sum(bits: int, mean_q: float, mean_r: float) -> float:
+    """
+    Sums the hex distances of the marbles on a bitboard to their mean position, lowest cell index first. The distances
+    go through sum like the main heuristic's, as it rounds differently from adding them one by one.
     """
-    return (wdc*distance_to_center(player_colour, board)
-            + wmc*marbles_coherence(player_colour, board)
-            + wes*marble_edge_safety(player_colour, board))
+    mean_s = -mean_q - mean_r
+    return sum([max(abs(q - mean_q), abs(r - mean_r), abs(s - mean_s)) for q, r, s in cells_of(bits)])
 
-def yz_heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: float, wmc: float, wsc: float) -> (
-        float):
-    """ add the score diff to the heuristic """
-    return (wdc*distance_to_center(player_colour, board)
-            + wmc*marbles_coherence(player_colour, board)
-            + wsc*score_difference(player_colour, board))
+# def heuristic(player_colour: str, board: Dict[Tuple[int, int, int], str], wdc: float, wmc: float, wsc: float) -> float:
+#     """ add the score diff to the heuristic """
+#     return (wdc*distance_to_center(player_colour, board)
+#             + wmc*marbles_coherence(player_colour, board)
+#             + wsc*score_difference(player_colour, board))
 
 def score_difference(player_colour: str, board: Dict[Tuple[int, int, int], str]) -> int:
     """
@@ -145,38 +176,42 @@ def euclidean_distance(pos1: Tuple[int, int, int], pos2: Tuple[int, int, int]):
     """
     return math.sqrt((pos2[0]-pos1[1]) ** 2 + (pos2[1] - pos1[1]) ** 2 + (pos2[2] - pos1[2]) ** 2)
 
+def _player_bits(player_colour: str, board: Dict[Tuple[int, int, int], str]) -> int:
+    """Returns the cells of the player's marbles as a bitboard."""
+    if isinstance(board, BitBoard):
+        return board.marbles(player_colour)
+    return _bits_of([pos for pos, color in board.items() if color == player_colour])
+
+def triangle_cells(bits: int) -> int:
+    """
+    Returns the cells of a bitboard that are corners of a triangle of three mutually adjacent cells in the set.
+
+    Every such triangle has either the shape {a, a + →, a + ↗} or the shape {a, a + →, a + ↘}, so the corners a of each
+    shape are found by intersecting the set with two of its shifts, and the other corners by shifting those back.
+    """
+    up = bits & shift(bits, 3) & shift(bits, 4) # a + → and a + ↗ are in the set
+    down = bits & shift(bits, 3) & shift(bits, 2) # a + → and a + ↘ are in the set
+    return up | shift(up, 0) | shift(up, 1) | down | shift(down, 0) | shift(down, 5)
+
 def triangle_formation(player_colour: str, board: Dict[Tuple[int, int, int], str]):
     """
-    A triangle formation is one where three or more marbles group up to form at the minimum, the three edges of a triangle.
+    A triangle formation is one where three marbles are mutually adjacent, forming the three corners of a triangle.
     When marbles are in a triangle formation, it requires the opponent to make an additional few moves to push the player
     marbles off the map.
 
-    Triangle definition:
-    pos1, pos2, pos3. Each pos contains coordinates (q, r, s).
-    q1 + 2 == (q2, q3)
-    r3 - 2 == (r1, r2)
-    s2 - 2 == (s1, s3)
+    The formation is scored from 0 to 10 by the fraction of the player's marbles that are a corner of at least one
+    triangle. The triangles are found with a few bitboard shifts (see triangle_cells), not by testing every triple of
+    marbles.
     """
+    return _triangle_score(_player_bits(player_colour, board))
+
+def _triangle_score(bits: int) -> float:
+    """Scores the triangle formation of the marbles on a bitboard, see triangle_formation."""
     max_score = 10.0
-    min_score = 0.0
 
-    positions = [(q, r, s) for (q, r, s), color in board.items() if color == player_colour]
-    if not positions or len(positions) < 3:
+    if bits.bit_count() < 3:
         return 0.0
-
-    scores = []
-
-    # Lots of iterations
-    for c in combinations(positions, 3):
-        d1 = euclidean_distance(c[0], c[1])
-        d2 = euclidean_distance(c[0], c[2])
-        d3 = euclidean_distance(c[1], c[2])
-
-        score = min(max_score, max_score - abs(d1-d2)+abs(d1-d3)+abs(d2-d3))
-        score = max(min_score, score)
-        scores.append(score)
-
-    return sum(scores)/len(scores)
+    return max_score * triangle_cells(bits).bit_count() / bits.bit_count()
 
 
 # test this one
@@ -192,19 +227,20 @@ def marbles_in_danger(board_obj, player: str) -> int:
     danger_count = 0
     opponent = Marble.WHITE.value if player == Marble.BLACK.value else Marble.BLACK.value
 
-    for (q, r, s), color in board_obj.marble_positions.items():
+    marble_positions = board_obj.marble_positions
+    for pos, color in marble_positions.items():
         if color != player:
             continue
+        cell = CELL_INDEX[pos]
 
         # Count opponent neighbors.
         opponent_neighbors = 0
-        for (dq, dr, ds) in DIRECTIONS.values():
-            neighbor_pos = (q + dq, r + dr, s + ds)
-            if board_obj.marble_positions.get(neighbor_pos) == opponent:
+        for neighbor_pos in ADJACENT_POSITIONS[cell]:
+            if marble_positions.get(neighbor_pos) == opponent:
                 opponent_neighbors += 1
 
         # Check if this marble is on the edge.
-        on_edge = abs(q) == 4 or abs(r) == 4 or abs(s) == 4
+        on_edge = EDGE_DISTANCE[cell] == 0
 
         # Count as "in danger" if:
         # - It has 2 or more opponent neighbors, OR
@@ -249,8 +285,7 @@ def marble_edge_safety(player: str, board: Dict[Tuple[int, int, int], str]) -> f
         # Count friendly and opponent neighbors
         friendly_neighbors = 0
         opponent_neighbors = 0
-        for (dq, dr, ds) in DIRECTIONS.values():
-            neighbor_pos = (q + dq, r + dr, s + ds)
+        for neighbor_pos in ADJACENT_POSITIONS[CELL_INDEX[(q, r, s)]]:
             neighbor_color = board.get(neighbor_pos)
             if neighbor_color == player:
                 friendly_neighbors += 1
@@ -266,6 +301,301 @@ def marble_edge_safety(player: str, board: Dict[Tuple[int, int, int], str]) -> f
     # Return average safety score, or 0 if no marbles
     return total_safety_score / marble_count if marble_count > 0 else 0.0
 
+# ---------------------------
+# Feature kernel
+# ---------------------------
+# Heuristics that weight features of the player's position are declared as a FeatureHeuristic, with one weight per
+# feature. All their features are extracted together in one pass over the board, each by a kernel working on the cell
+# indices and bitboards of that pass and the per-cell tables of cells.py. A kernel gives the same value as the feature
+# function of the same name, e.g. distance_to_center
+
+
+def _distance_to_center_kernel(own: List[int], own_bits: int, opponent_bits: int) -> float:
+    # (|q| + |r| + |s|) / 2 is the centre distance, and the sum of whole numbers is exact either way
+    return sum([CENTRE_DISTANCE[cell] for cell in own]) / len(own)
+
+def _marbles_coherence_kernel(own: List[int], own_bits: int, opponent_bits: int) -> float:
+    positions = [CELLS[cell] for cell in own]
+    mean_q = sum(q for q, r, s in positions) / len(positions)
+    mean_r = sum(r for q, r, s in positions) / len(positions)
+    mean_s = -mean_q - mean_r
+    return sum([max(abs(q - mean_q), abs(r - mean_r), abs(s - mean_s)) for q, r, s in positions]) / len(positions)
+
+def _marble_edge_safety_kernel(own: List[int], own_bits: int, opponent_bits: int) -> float:
+    total_safety_score = 0.0
+    for cell in own:
+        adjacent = ADJACENT_MASKS[cell]
+        safety_modifier = ((adjacent & own_bits).bit_count() * 0.2) - ((adjacent & opponent_bits).bit_count() * 0.3)
+        total_safety_score += max(0.0, min(1.0, AXIS_DISTANCE[cell] / 4.0 + safety_modifier))
+    return total_safety_score / len(own) if own else 0.0
+
+def _score_difference_kernel(own: List[int], own_bits: int, opponent_bits: int) -> int:
+    # Both players start with the same number of marbles
+    return own_bits.bit_count() - opponent_bits.bit_count()
+
+def _triangle_formation_kernel(own: List[int], own_bits: int, opponent_bits: int) -> float:
+    return _triangle_score(own_bits)
+
+# Registered features by name. A kernel takes the cell indices of the colour's marbles in board order and the
+# bitboards of its marbles and of the opponent's
+_FEATURE_KERNELS: Dict[str, Callable[[List[int], int, int], float]] = {
+    'distance_to_center': _distance_to_center_kernel,
+    'marbles_coherence': _marbles_coherence_kernel,
+    'marble_edge_safety': _marble_edge_safety_kernel,
+    'score_difference': _score_difference_kernel,
+    'triangle_formation': _triangle_formation_kernel,
+}
+FEATURES = tuple(_FEATURE_KERNELS)
+
+# Largest change in each feature from a push that does not push a marble off, see heuristic_delta_margin. The averages
+# of edge safety and triangle formation stay within [0, 1] and [0, 10]
+_FEATURE_PUSH_BOUNDS: Dict[str, float] = {
+    'distance_to_center': 1.0,
+    'marbles_coherence': 2.0,
+    'marble_edge_safety': 1.0,
+    'score_difference': 0.0,
+    'triangle_formation': 10.0,
+}
+
+
+def extract_features(board: Dict[Tuple[int, int, int], str], features: Sequence[str] = FEATURES,
+                     colours: Sequence[str] = (Marble.BLACK.value, Marble.WHITE.value)) -> Dict[str, Dict[str, float]]:
+    """
+    Extracts features of the position in a single pass over the board.
+
+    :param board: a BitBoard, or a dictionary of cube coordinates to marble colors
+    :param features: the names of the features to extract, see FEATURES
+    :param colours: the colours to extract the features for
+    :return: the value of each feature for each colour, by colour and then by feature name
+    """
+    black, white = Marble.BLACK.value, Marble.WHITE.value
+    if isinstance(board, BitBoard):
+        cells = {black: [low.bit_length() - 1 for low in iter_bits(board.black)],
+                 white: [low.bit_length() - 1 for low in iter_bits(board.white)]}
+        bits = {black: board.black, white: board.white}
+    else:
+        positions = {black: [], white: []}
+        for pos, color in board.items():
+            positions[color].append(pos)
+        cells = {colour: [CELL_INDEX[pos] for pos in positions[colour]] for colour in positions}
+        bits = {colour: _bits_of(positions[colour]) for colour in positions}
+
+    extracted = {}
+    for colour in colours:
+        own, own_bits = cells[colour], bits[colour]
+        opponent_bits = bits[white if colour == black else black]
+        extracted[colour] = {feature: _FEATURE_KERNELS[feature](own, own_bits, opponent_bits) for feature in features}
+    return extracted
+
+
+class FeatureHeuristic:
+    """
+    A heuristic declared as a weighted sum of features of the player's position (see FEATURES), called like the other
+    heuristics with one weight per feature after the board. Its features are extracted in one pass over the board, and
+    if every feature has a batched kernel the search scores the last ply with its batched version.
+    """
+    takes_bitboard = True # The kernel reads the search's BitBoard directly
+
+    def __init__(self, name: str, features: Sequence[str]):
+        """
+        :param name: the name shown for the heuristic, e.g. in the game configuration
+        :param features: the features the weights apply to, in the order of the weights
+        :raises ValueError: if a feature is not registered
+        """
+        unknown = [feature for feature in features if feature not in _FEATURE_KERNELS]
+        if unknown:
+            raise ValueError(f"Unknown features {unknown}, expected some of {FEATURES}")
+        self.__name__ = name
+        self.features = tuple(features)
+
+    def __repr__(self):
+        return f"FeatureHeuristic({self.__name__!r}, {self.features!r})"
+
+    def _check_weights(self, weights: Tuple[float, ...]) -> None:
+        if len(weights) != len(self.features):
+            raise TypeError(f"{self.__name__} takes {len(self.features)} weights but {len(weights)} were given")
+
+    def __call__(self, player_colour: str, board: Dict[Tuple[int, int, int], str], *weights: float) -> float:
+        """
+        :param board: a BitBoard, or a dictionary of cube coordinates to marble colors
+        :param weights: the weight of each feature
+        :return: heuristic value
+        """
+        self._check_weights(weights)
+        values = extract_features(board, self.features, (player_colour,))[player_colour]
+        total = 0
+        for feature, weight in zip(self.features, weights):
+            total += weight * values[feature]
+        return total
+
+    def delta_margin(self, *weights: float) -> float:
+        """
+        Bounds how much a push that does not push a marble off can change the heuristic, see heuristic_delta_margin.
+
+        :param weights: the weight of each feature
+        :return: the largest change in the heuristic value
+        """
+        self._check_weights(weights)
+        return sum(abs(weight) * _FEATURE_PUSH_BOUNDS[feature] for feature, weight in zip(self.features, weights))
+
+    @property
+    def batch(self):
+        """The batched version of the heuristic, None if one of its features has no batched kernel."""
+        if all(feature in _BATCH_FEATURE_KERNELS for feature in self.features):
+            return self._evaluate_batch
+        return None
+
+    def _evaluate_batch(self, player_colour: str, boards: np.ndarray, *weights: float) -> np.ndarray:
+        self._check_weights(weights)
+        total = 0
+        for feature, weight in zip(self.features, weights):
+            total = total + weight * _BATCH_FEATURE_KERNELS[feature](player_colour, boards)
+        return total
+
+
+c_heuristic = FeatureHeuristic('c_heuristic', ('distance_to_center', 'marbles_coherence', 'triangle_formation'))
+b_heuristic = FeatureHeuristic('b_heuristic', ('distance_to_center', 'marbles_coherence', 'marble_edge_safety'))
+yz_heuristic = FeatureHeuristic('yz_heuristic', ('distance_to_center', 'marbles_coherence', 'score_difference'))
+
+
+# ---------------------------
+# Batched evaluation
+# ---------------------------
+# The positions after every move of a node are scored together with vectorized NumPy. A batch of positions is an
+# (n, NUM_CELLS) int8 array with one column per cell: 1 for a black marble, -1 for a white marble and 0 for empty
+
+_CELL_Q, _CELL_R, _CELL_S = (np.array(column, dtype=np.float64) for column in zip(*CELLS))
+_CELL_DISTANCE = np.array(CENTRE_DISTANCE, dtype=np.float64)
+_CELL_BASE_SAFETY = np.array(AXIS_DISTANCE, dtype=np.float64) / 4.0
+_NEIGHBOUR_CELLS = np.array(NEIGHBOURS).reshape(NUM_CELLS, 6) # OFF_BOARD is the index of an always empty column
+
+
+def encode_bitboards(blacks: Sequence[int], whites: Sequence[int]) -> np.ndarray:
+    """
+    Encodes positions given as pairs of bitboards into a batch.
+
+    :param blacks: the black bitboard of every position
+    :param whites: the white bitboard of every position, in the same order
+    :return: the (n, NUM_CELLS) int8 batch
+    """
+    def unpack(bitboards: Sequence[int]) -> np.ndarray:
+        data = np.frombuffer(b''.join(bits.to_bytes(8, 'little') for bits in bitboards), dtype=np.uint8)
+        return np.unpackbits(data.reshape(-1, 8), axis=1, count=NUM_CELLS, bitorder='little').view(np.int8)
+    return unpack(blacks) - unpack(whites)
+
+
+def _colour_sign(player_colour: str) -> int:
+    return 1 if player_colour == Marble.BLACK.value else -1
+
+
+# Whether sum compensates the rounding of floats (Neumaier's algorithm, from Python 3.12)
+_SUM_IS_COMPENSATED = sum([1.0, 1e100, 1.0, -1e100]) == 2.0
+
+
+def _in_cell_order(own: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Gathers the values of the player's cells in each position, lowest cell index first like the scalar features, and
+    pads the rows with zeros, which leave the sums below unchanged.
+    """
+    count = own.sum(axis=1)
+    order = np.argsort(~own, axis=1, kind='stable')[:, :count.max(initial=0)]
+    return np.where(np.arange(order.shape[1]) < count[:, None], np.take_along_axis(values, order, axis=1), 0.0)
+
+
+def _sequential_sum(values: np.ndarray) -> np.ndarray:
+    """Sums the rows by adding their values one by one, like a loop adding floats."""
+    total = np.zeros(len(values))
+    for column in values.T:
+        total = total + column
+    return total
+
+
+def _builtin_sum(values: np.ndarray) -> np.ndarray:
+    """Sums the rows the way sum adds a list of floats, so the results are the same bit for bit."""
+    if not _SUM_IS_COMPENSATED:
+        return _sequential_sum(values)
+    total = np.zeros(len(values))
+    compensation = np.zeros(len(values))
+    for column in values.T:
+        added = total + column
+        compensation += np.where(np.abs(total) >= np.abs(column), (total - added) + column, (column - added) + total)
+        total = added
+    return np.where((compensation != 0) & np.isfinite(compensation), total + compensation, total)
+
+
+def batch_distance_to_center(player_colour: str, boards: np.ndarray) -> np.ndarray:
+    """Vectorized distance_to_center: the average hex distance of the player's marbles from the center."""
+    own = boards == _colour_sign(player_colour)
+    return (own * _CELL_DISTANCE).sum(axis=1) / own.sum(axis=1)
+
+
+def batch_marbles_coherence(player_colour: str, boards: np.ndarray) -> np.ndarray:
+    """Vectorized marbles_coherence: the average hex distance of the player's marbles from their mean position."""
+    own = boards == _colour_sign(player_colour)
+    count = own.sum(axis=1)
+    mean_q = (own * _CELL_Q).sum(axis=1) / count
+    mean_r = (own * _CELL_R).sum(axis=1) / count
+    mean_s = -mean_q - mean_r
+    distances = np.maximum(np.abs(_CELL_Q - mean_q[:, None]),
+                           np.maximum(np.abs(_CELL_R - mean_r[:, None]), np.abs(_CELL_S - mean_s[:, None])))
+    return _builtin_sum(_in_cell_order(own, distances)) / count
+
+
+def batch_score_difference(player_colour: str, boards: np.ndarray) -> np.ndarray:
+    """
+    Vectorized score_difference. Both players start with the same number of marbles, so it is the difference in
+    marble counts.
+    """
+    return (boards * _colour_sign(player_colour)).sum(axis=1, dtype=np.int64)
+
+
+def batch_marble_edge_safety(player_colour: str, boards: np.ndarray) -> np.ndarray:
+    """Vectorized marble_edge_safety: the average safety of the player's marbles, 0 if the player has none."""
+    sign = _colour_sign(player_colour)
+    own = boards == sign
+    neighbours = np.pad(boards, ((0, 0), (0, 1)))[:, _NEIGHBOUR_CELLS] # (n, NUM_CELLS, 6)
+    friendly_neighbours = (neighbours == sign).sum(axis=2)
+    opponent_neighbours = (neighbours == -sign).sum(axis=2)
+    safety = np.clip(_CELL_BASE_SAFETY + (friendly_neighbours * 0.2 - opponent_neighbours * 0.3), 0.0, 1.0)
+    count = own.sum(axis=1)
+    return np.where(count > 0, _sequential_sum(_in_cell_order(own, safety)) / np.maximum(count, 1), 0.0)
+
+
+def batch_heuristic(player_colour: str, boards: np.ndarray, wdc: float, wmc: float, wsc: float) -> np.ndarray:
+    """
+    Vectorized heuristic, scoring a batch of positions. The values are the same bit for bit as heuristic's on the
+    boards of a BitBoard, whose marbles come lowest cell first.
+
+    :param boards: the (n, NUM_CELLS) batch of positions, see encode_bitboards
+    :return: the n heuristic values
+    """
+    black, white = Marble.BLACK.value, Marble.WHITE.value
+    distance_to_center_val = batch_distance_to_center(white, boards) - batch_distance_to_center(black, boards)
+    coherence_val = batch_marbles_coherence(white, boards) - batch_marbles_coherence(black, boards)
+    score_diff = batch_score_difference(black, boards)
+    return (wdc * distance_to_center_val
+            + wmc * coherence_val
+            + wsc * score_diff)
+
+
+# Batched kernels of the registered features, see FeatureHeuristic
+_BATCH_FEATURE_KERNELS: Dict[str, Callable[[str, np.ndarray], np.ndarray]] = {
+    'distance_to_center': batch_distance_to_center,
+    'marbles_coherence': batch_marbles_coherence,
+    'marble_edge_safety': batch_marble_edge_safety,
+    'score_difference': batch_score_difference,
+}
+
+
+# The search scores the children of its last ply with the batched version of a heuristic where it has one
+heuristic.batch = batch_heuristic
+incremental_heuristic.batch = batch_heuristic
+
+# The quiescence search skips pushes that cannot lift the evaluation above alpha by the heuristic's delta margin
+heuristic.delta_margin = heuristic_delta_margin
+incremental_heuristic.delta_margin = heuristic_delta_margin
+
+
 """
 keep heuristic simple and get deeper search, and it overlaps with coherence
 If the agent's search is deep enough, then break_opponent_formation() becomes partially redundant.
@@ -351,6 +681,12 @@ def t_euclidean_distance(pos1: Tuple[int, int, int],
         (pos2[2] - pos1[2]) ** 2
     )
 
+def _build_cell_distances() -> List[List[float]]:
+    """Precomputes t_euclidean_distance between every pair of cells."""
+    return [[t_euclidean_distance(pos1, pos2) for pos2 in CELLS] for pos1 in CELLS]
+
+_CELL_DISTANCES = _build_cell_distances()
+
 
 def t_marbles_coherence(game_state: GameState) -> float:
     """
@@ -405,26 +741,19 @@ def t_marbles_in_danger(board_obj, player: str) -> int:
     opponent = Marble.WHITE.value if player == Marble.BLACK.value else Marble.BLACK.value
     danger_count = 0
 
-    edge_positions = {
-        (q, r, s)
-        for q in range(-4, 5)
-        for r in range(-4, 5)
-        for s in range(-4, 5)
-        if q + r + s == 0 and (abs(q) == 4 or abs(r) == 4 or abs(s) == 4)
-    }
-
-    for (q, r, s), color in board_obj.marble_positions.items():
+    marble_positions = board_obj.marble_positions
+    for pos, color in marble_positions.items():
         if color != player:
             continue
+        cell = CELL_INDEX[pos]
 
         # Quick edge check
-        on_edge = (q, r, s) in edge_positions
+        on_edge = EDGE_DISTANCE[cell] == 0
 
         # Count neighboring opponent marbles
         opponent_neighbors = 0
-        for dq, dr, ds in DIRECTIONS.values():
-            neighbor_pos = (q + dq, r + dr, s + ds)
-            if board_obj.marble_positions.get(neighbor_pos) == opponent:
+        for neighbor_pos in ADJACENT_POSITIONS[cell]:
+            if marble_positions.get(neighbor_pos) == opponent:
                 opponent_neighbors += 1
                 # Early termination: if danger condition is met
                 if opponent_neighbors >= 2 or (on_edge and opponent_neighbors >= 1):
@@ -441,6 +770,30 @@ def t_marbles_in_danger(board_obj, player: str) -> int:
 # Formation Detection (Prefixed with t_)
 # ---------------------------
 
+def _is_equilateral(d1: float, d2: float, d3: float) -> bool:
+    """Checks if three side lengths are those of an equilateral triangle, with a 10% tolerance."""
+    return (
+            math.isclose(d1, d2, rel_tol=0.1) and
+            math.isclose(d1, d3, rel_tol=0.1) and
+            math.isclose(d2, d3, rel_tol=0.1)
+    )
+
+def _build_triangle_table() -> List[List[int]]:
+    """
+    Precomputes every triple of cells that t_is_triangle accepts, 710 of the 35990 triples on the board. Each triangle
+    is listed under its lowest cell as the bitboard of its other two cells.
+    """
+    distances = _CELL_DISTANCES
+    table = [[] for _ in range(NUM_CELLS)]
+    for cell1, cell2, cell3 in combinations(range(NUM_CELLS), 3):
+        if _is_equilateral(distances[cell1][cell2], distances[cell1][cell3], distances[cell2][cell3]):
+            table[cell1].append(1 << cell2 | 1 << cell3)
+    return table
+
+_TRIANGLES_BY_CELL = _build_triangle_table()
+_TRIANGLES = frozenset(1 << cell | others for cell, triangles in enumerate(_TRIANGLES_BY_CELL) for others in triangles)
+
+
 def t_is_triangle(pos1: Tuple[int, int, int],
                   pos2: Tuple[int, int, int],
                   pos3: Tuple[int, int, int]) -> bool:
@@ -453,15 +806,30 @@ def t_is_triangle(pos1: Tuple[int, int, int],
     :param pos3: Third marble position
     :return: True if the three positions form an equilateral triangle, False otherwise
     """
-    d1 = t_euclidean_distance(pos1, pos2)
-    d2 = t_euclidean_distance(pos1, pos3)
-    d3 = t_euclidean_distance(pos2, pos3)
+    cells = _bits_of([pos1, pos2, pos3])
+    if cells.bit_count() < 3: # Repeated positions only pass the distance test if all three are the same
+        return pos1 == pos2 == pos3
+    return cells in _TRIANGLES
 
-    return (
-            math.isclose(d1, d2, rel_tol=0.1) and
-            math.isclose(d1, d3, rel_tol=0.1) and
-            math.isclose(d2, d3, rel_tol=0.1)
-    )
+
+def t_count_triangles(positions: List[Tuple[int, int, int]]) -> int:
+    """
+    Counts the triples of marbles that form an equilateral triangle (see t_is_triangle), looking up the precomputed
+    triangles of each marble instead of testing every triple.
+
+    :param positions: List of marble positions
+    :return: Number of triangles
+    """
+    bits = _bits_of(positions)
+    count = 0
+    remaining = bits
+    while remaining:
+        low = remaining & -remaining
+        for others in _TRIANGLES_BY_CELL[low.bit_length() - 1]:
+            if bits & others == others:
+                count += 1
+        remaining ^= low
+    return count
 
 
 def t_detect_wedge(positions: List[Tuple[int, int, int]]) -> int:
@@ -469,26 +837,13 @@ def t_detect_wedge(positions: List[Tuple[int, int, int]]) -> int:
     Detects wedge formations, where three marbles are aligned in an arrow shape suitable for pushing.
     (Three Marbles in a Straight Line with Distance of 1)
 
+    Every such line is counted once by its middle marble, which has marbles on both sides along one of the three axes.
+
     :param positions: List of marble positions
     :return: Number of wedge formations detected
     """
-    wedge_count = 0
-    direction_set = set(DIRECTIONS.values())
-    for trio in combinations(positions, 3):
-        sorted_trio = sorted(trio)
-        delta1 = (
-            sorted_trio[1][0] - sorted_trio[0][0],
-            sorted_trio[1][1] - sorted_trio[0][1],
-            sorted_trio[1][2] - sorted_trio[0][2]
-        )
-        delta2 = (
-            sorted_trio[2][0] - sorted_trio[1][0],
-            sorted_trio[2][1] - sorted_trio[1][1],
-            sorted_trio[2][2] - sorted_trio[1][2]
-        )
-        if delta1 == delta2 and delta1 in direction_set:
-            wedge_count += 1
-    return wedge_count
+    bits = _bits_of(positions)
+    return sum((bits & shift(bits, direction) & shift(bits, direction + 3)).bit_count() for direction in range(3))
 
 
 def t_detect_chains(positions: List[Tuple[int, int, int]],
@@ -569,7 +924,7 @@ def t_heuristic(
     return (
             w_center * t_distance_to_center(game_state) +
             w_coherence * t_marbles_coherence(game_state) +
-            w_triangle * sum(1 for c in combinations(positions, 3) if t_is_triangle(*c)) +
+            w_triangle * t_count_triangles(positions) +
             w_wedge * t_detect_wedge(positions) +
             w_chain * t_detect_chains(positions) +
             w_danger * t_marbles_in_danger(game_state.board, game_state.player)
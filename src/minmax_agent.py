@@ -1,18 +1,29 @@
 """ this agent will use all the modules to generate a best move"""
-from state_space import GameState, apply_move_dict, generate_move, terminal_test, generate_move_dict, check_win, game_status
-from transposition_tables import TranspositionTable
-from typing import Tuple, Dict, List
-from moves import Move
+from state_space import GameState, apply_move_dict, generate_move, terminal_test, check_win, game_status, make_move, unmake_move, \
+    generate_moves_staged, LegalMoveIndex
+from transposition_tables import TranspositionTable, PLAYER_KEYS
+from typing import Tuple, Dict, Iterator, List
+from moves import Move, compact_to_move
+from bitboard import BitBoard, generate_bitboard_moves, generate_push_moves, MOVE_DELTAS
+from search_worker import SearchWorker
+from search_clock import SearchClock, SearchStopped, CHECK_MASK
+from move_ordering import MoveOrdering
+from parallel_search import ParallelRootSearch, LazySMPSearch
+from heuristic import encode_bitboards
 import  math
 import time
-from enums import Marble, GameMode
+from enums import Marble, GameMode, SearchBackend
 from board import Board
 import random
 from file_paths import *
-import multiprocessing, queue
+from file_watcher import modified_time
 import logging
 logging.basicConfig(level=logging.DEBUG)  # Configure logging
 
+ASPIRATION_WINDOW = 0.5 # Half width of the root window around the previous iteration's score
+NULL_WINDOW = 1e-6 # Width of the windows that only test whether a move beats the best so far
+QUIESCENCE_MAX_PLY = 6 # Deepest push sequence followed past the nominal depth
+
 class AgentConfiguration:
     """
     Contains data attributes related to a game configuration.
@@ -51,7 +62,7 @@ class MinimaxAgent:
     Attributes:
         depth (int): Search depth for minimax algorithm
         weights (dict): Weight values for heuristic components
-        transposition_table (TranspositionTable): Cache for game state evaluations
+        transposition_table (TranspositionTable): Cache for game state evaluations, kept for the whole game
     """
 
     def __init__(self,
@@ -59,7 +70,10 @@ class MinimaxAgent:
                  player_config: AgentConfiguration,
                  opponent_config: AgentConfiguration,
                  game_mode: GameMode,
-                 depth = 3
+                 depth = 3,
+                 tt_size_mb: int = TranspositionTable.DEFAULT_SIZE_MB,
+                 search_workers: int = 1,
+                 search_backend: SearchBackend = SearchBackend.ROOT_SPLIT
                  ):
         """
         Initialize minimax agent with search parameters
@@ -69,6 +83,9 @@ class MinimaxAgent:
         :param opponent_config: the configuration of the opponent
         :param game_mode: the game mode to play, as an enum
         :param depth: maximum search depth (default: 3). A depth of -1 is valid and is considered an "infinite" depth. This depth makes the model continue the search until time runs out
+        :param tt_size_mb: the memory in megabytes of the transposition table, which stays fixed for the whole game
+        :param search_workers: the number of processes that search in parallel, 1 to search serially
+        :param search_backend: how the search is split across the processes when there is more than one
         """
         # Player config
         self.player_colour = Marble.BLACK.value # Player should always be black
@@ -91,9 +108,48 @@ class MinimaxAgent:
         self.time_limit = player_config.time_limit
         self.depth = 10**9 if depth == -1 else depth # Set an "infinite" depth
         self.game_state = GameState(self.player_colour, board)
-        self.transposition_table = TranspositionTable()
+        self.transposition_table = TranspositionTable(tt_size_mb)
         self.game_mode = game_mode
-        self.last_read_board_file = None
+        self.last_read_board_file = None # Modification time of the GUI's board file already seen, see run_game
+
+        # Search state
+        self.search_worker = None # Started on the player's first searched turn and kept for the whole game
+        self.search_workers = max(1, search_workers)
+        self.search_backend = search_backend
+        self.parallel_search = None # Process pool of the parallel search, started on the first search
+        self.search_count = 0 # Searches run so far, tells the pool processes when a new search starts
+        self.stop_event = None # Set by the parent process to stop a search running in the worker
+        self.clock = None # Deadlines of the current search
+        self.nodes = 0 # Nodes visited by the current search
+        self.qnodes = 0 # Of those, nodes visited by the quiescence search
+        self.search_table = self.transposition_table # Table of the current search
+        self.opponent_transposition_table = None # Created for the first simulated opponent search
+        self.root_best_move = None # Best root move of the current iteration, kept if the search is stopped
+        self.move_ordering = MoveOrdering() # Killer and history tables, kept between iterations and aged between searches
+        self.evaluation_colour = self.player_colour # Colour the heuristic scores positions for in the current search
+        self.evaluation = self.heuristic
+        self.evaluation_args = self.heuristic_weights
+        self.evaluation_takes_bitboard = False # Whether the heuristic reads the search's BitBoard directly
+        self.batch_evaluation = None # Vectorized version of the heuristic scoring the children of the last ply at once
+        self.delta_margin = math.inf # Most a push that does not push a marble off can raise the evaluation
+        self.player_moves_made = 0
+        self.opponent_moves_made = 0
+
+    def __getstate__(self):
+        # The worker and the pool hold process handles, only the process that started them talks to them
+        state = self.__dict__.copy()
+        state['search_worker'] = None
+        state['parallel_search'] = None
+        return state
+
+    def close_search(self):
+        """Stops the processes started by the search."""
+        if self.search_worker is not None:
+            self.search_worker.close()
+            self.search_worker = None
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
 
 
     def run_game(self):
@@ -102,15 +158,18 @@ class MinimaxAgent:
         If this is the player's first move, a random move is selected.
         """
         print(game_status(self.game_state.board.marble_positions)) # Debug
+        self.last_read_board_file = modified_time(FilePaths.BOARD_INPUT.value) # A board left from an earlier game is old
         # First move logic
         player_first_move = True
         while player_first_move:
             if self.current_move: # Players first move, this will be random
                 self._player_first_turn_random()
+                self.player_moves_made += 1
                 player_first_move = False # Player has ran their first move
                 print("Random first turn: Applied")
             else:
                 self._opponent_turn()
+                self.opponent_moves_made += 1
 
             self.current_move = not self.current_move # Alternate move
 
@@ -123,9 +182,11 @@ class MinimaxAgent:
 
             if self.current_move:
                 self._player_turn()
+                self.player_moves_made += 1
 
             else:
                 self._opponent_turn()
+                self.opponent_moves_made += 1
                 print("Opponent turn ended")
 
             self.current_move = not self.current_move # Alternate move
@@ -134,6 +195,7 @@ class MinimaxAgent:
 
         print("Game over")
         print(check_win(self.game_state.board.marble_positions), "won")
+        self.close_search()
 
 
     def _player_turn(self):
@@ -141,25 +203,14 @@ class MinimaxAgent:
         print("\nPlayer Turn\n")
         start = time.time()
 
-        # Add a queue for moves, run the iterative deepening search
-        best_move_queue = multiprocessing.Queue()
-        search_process = multiprocessing.Process(target=self.iterative_deepening_search, args=(best_move_queue, True, self.heuristic,
-                                                                      self.heuristic_weights))
-        search_process.start()
-        search_process.join(timeout=self.time_limit)
-
-        if search_process.is_alive():
-            search_process.terminate()
-            search_process.join()
-        search_process.close()
-
-        try:
-            best_move, depth = best_move_queue.get_nowait()
-            print(f"Using best move at depth: {depth}")
-        except queue.Empty:
-            print("Empty queue")
-            best_move = None
-            depth = None
+        # Run the iterative deepening search in the worker process, which keeps its search state between turns
+        if self.search_worker is None:
+            self.search_worker = SearchWorker(self)
+        best_move, depth = self.search_worker.search(self.board.marble_positions, True, self.heuristic,
+                                                     self.heuristic_weights, self.time_limit, self._plies_left())
+        if best_move is None: # Still move within the time limit
+            print("No search iteration finished, playing a random move")
+            best_move = self._get_random_move(self.player_colour)
 
         if best_move:
             self.game_state.apply_move(best_move) # Update the board configuration
@@ -171,16 +222,29 @@ class MinimaxAgent:
 
 
 
+    def _plies_left(self) -> int:
+        """Returns the number of moves both sides may still make before the move limits end the game."""
+        return (max(0, self.player_move_limit - self.player_moves_made)
+                + max(0, self.opponent_move_limit - self.opponent_moves_made))
+
+
     def _opponent_turn(self):
         """Handles the opponent turn logic."""
         print("\nOpponent Turn\n")
 
         match self.game_mode:
             case GameMode.HUMAN:
-                board_str, last_read_board_time = read_from_output_game_file(FilePaths.BOARD_INPUT, self.last_read_board_file)
-                self.last_read_board_file = last_read_board_time
-                self.board.update_board_from_str(board_str) # NOTE: Updates the board configuration from str
+                # Search the player's next turn on the opponent's time
+                if self.search_worker is None:
+                    self.search_worker = SearchWorker(self)
+                self.search_worker.ponder(self.board.marble_positions, self.heuristic, self.heuristic_weights,
+                                          self._plies_left())
+                move = self._read_opponent_move()
+                self.game_state.apply_move(move)
                 print("Updated board")
+                predicted_move = self.search_worker.stop_ponder()
+                if predicted_move is not None:
+                    print(f"Pondered {predicted_move}: {'hit' if predicted_move == move else 'miss'}") # Debug
             case GameMode.RANDOM:
                 self._opponent_turn_random()
             case GameMode.DIFF_HEURISTIC:
@@ -189,6 +253,28 @@ class MinimaxAgent:
                 self._opponent_turn_heuristic()
 
 
+    def _read_opponent_move(self) -> Move:
+        """
+        Waits for the GUI to write the board after the opponent's move and finds the move that was played from the
+        cells that changed. A board that no legal opponent move leads to is rejected and the next one waited for.
+
+        :return: the opponent's move
+        """
+        legal_moves = LegalMoveIndex(self.opponent_colour, BitBoard.from_dict(self.board.marble_positions))
+        while True:
+            board_str, self.last_read_board_file = read_from_output_game_file(FilePaths.BOARD_INPUT,
+                                                                              self.last_read_board_file)
+            try:
+                after = BitBoard.from_dict(Board.parse_board_str(board_str))
+            except ValueError as error:
+                print(f"Rejected board: {error}")
+                continue
+            move = legal_moves.find(after)
+            if move is not None:
+                return compact_to_move(move, self.opponent_colour)
+            print("Rejected board: no legal opponent move leads to it")
+
+
     def _output_game_state(self, move: str, board_state: str):
         """
         Outputs the current game state of the agent, including: Move and Board configuration.
@@ -196,6 +282,8 @@ class MinimaxAgent:
         :param move: the move string in the format: (0,0,0,b)→(1,0,-1,b)
         :param board_state: the board state in the format C5b, A2w, ...
         """
+        # The GUI answers only after seeing this move, any board it wrote before is old
+        self.last_read_board_file = modified_time(FilePaths.BOARD_INPUT.value)
         write_to_output_game_file(FilePaths.MOVES, move)
         write_to_output_game_file(FilePaths.BOARD_OUTPUT, board_state)
 
@@ -221,7 +309,9 @@ class MinimaxAgent:
                 None,
                 False,
                 self.opponent_heuristic,
-                self.opponent_heuristic_weights
+                self.opponent_heuristic_weights,
+                self.opponent_time_limit,
+                self._plies_left()
             )
         if move_to_make:
             self.game_state.apply_move(move_to_make)
@@ -268,133 +358,221 @@ class MinimaxAgent:
             else:
                 return opponent_move
 
-    def iterative_deepening_search(self, best_move_queue, is_player: bool, heuristic, args) -> Move | None:
-        self.transposition_table.clear()
-        best_move = None
+    def iterative_deepening_search(self, best_move_queue, is_player: bool, heuristic, args,
+                                   time_limit: float | None = None, plies_left: int | None = None,
+                                   ponder: bool = False, start: float | None = None) -> Move | None:
+        """
+        Searches one depth deeper on every iteration until the maximum depth or the time runs out.
 
-        for depth in range(1, self.depth + 1):
-            best_score = -math.inf
+        Each iteration is a principal variation search whose root window is an aspiration window centred on the score
+        of the previous iteration, widened and searched again when the score falls outside it.
+
+        The search stops itself at the hard deadline of its clock, keeping the best move found so far. Iterations that
+        cannot finish in time, judged by the effective branching factor, are not started.
+
+        :param best_move_queue: an optional queue receiving (best move, depth) after every iteration
+        :param is_player: True to search for the player, False for the opponent
+        :param heuristic: the heuristic function to use
+        :param args: the weights
+        :param time_limit: the seconds the move may take, None for no limit
+        :param plies_left: the moves left before the move limits end the game, the search never looks past them
+        :param ponder: True to search the position with the other side to move, filling the table for the searches of
+                       the positions it can reach. The search goes one ply deeper so those have entries at full depth
+        :param start: the time.monotonic() at which the move's time started, now if None
+        :return: the best move found, for the other side if pondering
+        """
+        clock = SearchClock(time_limit, self.stop_event, start) # Before any setup, which counts against the time too
+        self._start_search(is_player, heuristic, args, clock)
+        best_move = None
+        player_colour = self.player_colour if is_player else self.opponent_colour
+        if ponder:
+            player_colour = GameState.get_next_turn_colour(player_colour)
+        root = BitBoard.from_dict(self.board.marble_positions)
+        moves = generate_bitboard_moves(player_colour, root)
+        if not moves:
+            return None
+        entry = self.search_table.lookup(root.hash ^ PLAYER_KEYS[player_colour])
+        if entry and entry.best_move in moves: # Left by a ponder that predicted this position
+            moves.remove(entry.best_move)
+            moves.insert(0, entry.best_move)
+        depth_limit = self.depth + 1 if ponder else self.depth
+        max_depth = depth_limit if plies_left is None else max(1, min(depth_limit, plies_left - 1))
+        previous_score = None
+        parallel_search = self._get_parallel_search()
+        if parallel_search is not None:
+            parallel_search.start(self, player_colour, root, max_depth, is_player)
+
+        for depth in range(1, max_depth + 1):
+            if depth > 1 and not self.clock.can_start_iteration():
+                break
+            self.clock.start_iteration()
+            iteration_start_nodes = self.nodes
+            stopped = False
             current_best_move = None
+            best_score = -math.inf
+            self.root_best_move = None
 
-            # Generate moves for current depth
-            moves = generate_move_dict(self.player_colour if is_player else self.opponent_colour, self.board.marble_positions)
-
-            # # 1) Separate pushes from non-pushes
-            # push_moves = [mv for mv in moves if mv.push]
-            # non_push_moves = [mv for mv in moves if not mv.push]
-            #
-            # # 2) Sort the non-push moves by your quick heuristic
-            # non_push_moves_sorted = sorted(
-            #     non_push_moves,
-            #     key=lambda m: self.quick_heuristic_eval(
-            #         m,
-            #         self.player_colour if is_player else self.opponent_colour,
-            #         heuristic,
-            #         args
-            #     ),
-            #     reverse=True
-            # )
-            #
-            # # 3) Keep the top 20 non-push moves
-            # top_non_push = non_push_moves_sorted[:10]
-            #
-            # # 4) Combine them back. This ensures *all push moves* stay in the final list.
-            # moves = push_moves + top_non_push
-            #
-            # moves = sorted(
-            #     moves,
-            #     key=lambda m: self.quick_heuristic_eval(
-            #         m,
-            #         self.player_colour if is_player else self.opponent_colour,
-            #         heuristic,
-            #         args
-            #     ),
-            #     reverse=True
-            # )[:20]
-
-            for move in moves:
-                # if move.pushed_off:
-                #     return move
-                new_board = self.board.copy()
-                apply_move_dict(new_board, move)
-
-                score = self.mini_max(
-                    not is_player,
-                    new_board,
-                    depth,
-                    heuristic,
-                    args,
-                )
-                if score > best_score:
-                    best_score = score
-                    current_best_move = move
+            if previous_score is None or math.isinf(previous_score):
+                alpha, beta = -math.inf, math.inf
+            else:
+                alpha, beta = previous_score - ASPIRATION_WINDOW, previous_score + ASPIRATION_WINDOW
+            try:
+                while True:
+                    if parallel_search is not None:
+                        best_score, move = parallel_search.search_root(self, player_colour, root, moves, depth, alpha,
+                                                                       beta, is_player)
+                    else:
+                        best_score, move = self._search_root(player_colour, root, moves, depth, alpha, beta)
+                    if best_score <= alpha and alpha > -math.inf: # Fail low: every move is worse than expected
+                        alpha = -math.inf
+                    elif best_score >= beta and beta < math.inf: # Fail high: a move is better than expected
+                        current_best_move = move
+                        beta = math.inf
+                    else:
+                        current_best_move = move
+                        break
+            except SearchStopped:
+                # Root moves are ordered best first, so a move that beat the previous best at this depth before the
+                # deadline is kept. The board being searched is not reused
+                current_best_move = self.root_best_move
+                stopped = True
 
             if current_best_move is not None:
-                best_move = current_best_move
-                while not best_move_queue.empty(): # Clear the current queue
-                    best_move_queue.get_nowait()
-                best_move_queue.put((best_move, depth)) # Add the best move and depth to the queue
+                previous_score = best_score
+                # Search the best move first in the next iteration
+                moves.remove(current_best_move)
+                moves.insert(0, current_best_move)
+                best_move = compact_to_move(current_best_move, player_colour)
+                if best_move_queue is not None:
+                    best_move_queue.put((best_move, depth)) # Report the best move and depth of this iteration
             print(best_score,best_move)
-
+            print(f"Nodes: {self.nodes}, quiescence nodes: {self.qnodes}") # Debug
+            print(f"Transposition table: {self.search_table.stats()}") # Debug
+            if stopped:
+                break
+            self.clock.finish_iteration(self.nodes - iteration_start_nodes)
+
+        if parallel_search is not None:
+            parallel_search.finish(self)
         return best_move
 
 
-    def mini_max(self, is_player: bool, board: Dict[Tuple[int, int, int], str], depth: int, heuristic, args) -> float:
-        """
-        Minimax algorithm.
+    def _get_parallel_search(self) -> ParallelRootSearch | LazySMPSearch | None:
+        """Returns the process pool splitting the search, started on first use, or None if the search is serial."""
+        if self.search_workers == 1:
+            return None
+        if self.parallel_search is None:
+            if self.search_backend == SearchBackend.LAZY_SMP:
+                self.parallel_search = LazySMPSearch(self, self.search_workers)
+            else:
+                self.parallel_search = ParallelRootSearch(self, self.search_workers)
+        return self.parallel_search
 
-        :param is_player: True if mini max should be ran for the player, False if it should be ran for the opponent
-        :param board: the current board state as a dictionary
-        :param depth: the depth to run the search
-        :param heuristic: the heuristic function to use
-        :param args: the weights
-        :return: the move with the best score for the player to take 
+
+    def _get_search_table(self, is_player: bool) -> TranspositionTable:
+        """
+        Returns the transposition table of the player's or the opponent's searches. The opponent's simulated searches
+        use their own table, as their heuristic scores positions differently.
         """
         if is_player:
-            return self.max_value(
-                self.player_colour,
-                board,
-                depth,
-                -math.inf,
-                math.inf,
-                heuristic,
-                args,
-        )
-        else:
-            return self.min_value(
-                self.opponent_colour,
-                board,
-                depth,
-                -math.inf,
-                math.inf,
-                heuristic,
-                args 
-        )
-
-
-    def max_value(
-            self,
-            player_colour: str,
-            board: Dict[Tuple[int, int, int], str],
-            depth: int,
-            alpha: float,
-            beta: float,
-            heuristic,
-            args
-    ) -> float:
-        """
-        A minimax algorithm that determines the best move to take for the current player.
-
-        :param player_colour: True if mini max should be ran for the player, False if it should be ran for the opponent
-        :param board: the current board state as a dictionary
+            return self.transposition_table
+        if self.opponent_transposition_table is None:
+            self.opponent_transposition_table = TranspositionTable(TranspositionTable.DEFAULT_SIZE_MB // 4)
+        return self.opponent_transposition_table
+
+
+    def _start_search(self, is_player: bool, heuristic, args, clock: SearchClock | None, new_generation: bool = True):
+        """
+        Resets the per-search state: the clock, the node counter, the evaluation and the transposition table to use.
+
+        :param clock: the clock of the search, already running. None for a search without a time limit
+        :param new_generation: False when joining a search another process started on the same table
+        """
+        self.search_table = self._get_search_table(is_player)
+        if new_generation:
+            self.search_table.new_search() # Keep entries from earlier turns, they are replaced first
+        self.move_ordering.new_search()
+        self.search_count += 1
+        self.clock = clock if clock is not None else SearchClock(None, self.stop_event)
+        self.nodes = 0
+        self.qnodes = 0
+        self.root_best_move = None
+        self.evaluation_colour = self.player_colour if is_player else self.opponent_colour
+        self.evaluation = heuristic
+        self.evaluation_args = args
+        self.evaluation_takes_bitboard = getattr(heuristic, 'takes_bitboard', False)
+        self.batch_evaluation = getattr(heuristic, 'batch', None)
+        delta_margin = getattr(heuristic, 'delta_margin', None) # Without a bound, no push is pruned
+        self.delta_margin = delta_margin(*args) if delta_margin is not None else math.inf
+
+
+    def _search_root(self, player_colour: str, root: BitBoard, moves: List[int], depth: int, alpha: float,
+                     beta: float, scout: bool = False) -> Tuple[float, int | None]:
+        """
+        Principal variation search of the root moves. The first move is searched with the full window, the others with
+        a null window that only proves them worse, and are searched again with the full window if they are not.
+
+        :param player_colour: the colour to move at the root
+        :param root: the root board, restored before returning
+        :param moves: the root moves, best first
+        :param depth: the depth to search each move to
+        :param alpha: the lower bound of the root window
+        :param beta: the upper bound of the root window
+        :param scout: True to search the first move with a null window too, when a better move is already known
+        :return: the best score and the move with that score. The score is only an upper bound if it is at most alpha
+        """
+        opponent_colour = GameState.get_next_turn_colour(player_colour)
+        best_score, best_move = -math.inf, None
+        for index, move in enumerate(moves):
+            undo = make_move(root, move, player_colour)
+            if index == 0 and not scout:
+                score = -self.negamax(opponent_colour, root, depth, -beta, -alpha, 1)
+            else:
+                score = -self.negamax(opponent_colour, root, depth, -alpha - NULL_WINDOW, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self.negamax(opponent_colour, root, depth, -beta, -score, 1)
+            unmake_move(root, undo)
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                self.root_best_move = move
+            if alpha >= beta:
+                break
+        return best_score, best_move
+
+
+    def negamax(self, player_colour: str, board: BitBoard, depth: int, alpha: float, beta: float, ply: int = 0,
+                stand_pat: float | None = None) -> float:
+        """
+        Principal variation search in negamax form: scores are from the point of view of the player to move, and a
+        child's score is the negation of its own.
+
+        Moves are ordered by the staged generator: the transposition table move, pushes, this ply's killer moves and
+        then quiet moves by their history score. The first move is searched with the full window. The remaining moves are
+        searched with a null window that only proves they are no better, and searched again with the full window if
+        that proof fails. One ply from the leaves, the children left after the first are scored in one call of the
+        heuristic's batched version if it has one.
+
+        :param player_colour: the colour of the player to move
+        :param board: the current board state as a BitBoard, restored before returning
         :param depth: the depth to run the search
-        :param alpha: the alpha value of the caller
-        :param beta: the beta value of the caller
-        :param heuristic: the heuristic function to use
-        :param args: the weights
-        :return: the move with the best score for the player to take for maximizing
+        :param alpha: the score the player to move is already guaranteed
+        :param beta: the score the opponent is already guaranteed, as seen by the player to move
+        :param ply: the distance from the root, used for the killer moves
+        :param stand_pat: the static evaluation of the position if already known, only used at depth 0
+        :return: the score of the position for the player to move
         """
-        entry = self.transposition_table.lookup(player_colour, board)
+        if depth == 0:
+            return self.quiescence(player_colour, board, alpha, beta, stand_pat=stand_pat)
+
+        self.nodes += 1
+        if self.nodes & CHECK_MASK == 0:
+            self.clock.check()
+
+        hash_key = board.hash ^ PLAYER_KEYS[player_colour]
+        entry = self.search_table.lookup(hash_key)
+        tt_move = entry.best_move if entry else None
         if entry and entry.depth >= depth:
             if entry.flag == 'exact':
                 return entry.value
@@ -403,59 +581,75 @@ class MinimaxAgent:
             elif entry.flag == 'upper' and entry.value <= alpha:
                 return entry.value
 
-        if depth == 0 or terminal_test(board):
-            value = heuristic(player_colour, board, *args)
-            self.transposition_table.store(player_colour, board, value, depth, 'exact')
+        if terminal_test(board):
+            value = self._evaluate(player_colour, board)
+            self.search_table.store(hash_key, value, depth, 'exact')
             return value
 
-        v = -math.inf
-        moves_generated = generate_move_dict(player_colour, board)
-        for move in moves_generated:
-            new_board = board.copy()
-            apply_move_dict(new_board, move)
-            child_value = self.min_value(
-                Marble.BLACK.value if player_colour == Marble.WHITE.value else Marble.WHITE.value,
-                new_board,
-                depth - 1,
-                alpha,
-                beta,
-                heuristic,
-                args
-            )
-            v = max(v, child_value)
-            if v >= beta:
-                self.transposition_table.store(player_colour, board, v, depth, 'lower')
-                return v
-            alpha = max(alpha, v)
-
-        flag = 'exact' if alpha < v < beta else 'upper'
-        self.transposition_table.store(player_colour, board, v, depth, flag)
-        return v
-
-    def min_value(
-            self,
-            player_colour: str,
-            board: Dict[Tuple[int, int, int], str],
-            depth: int,
-            alpha: float,
-            beta: float,
-            heuristic,
-            args
-        ) -> float:
-        """
-        A minimax algorithm that determines the best move to take for the opponent.
-
-        :param player_colour: True if mini max should be ran for the player, False if it should be ran for the opponent
-        :param board: the current board state as a dictionary
-        :param depth: the depth to run the search
-        :param alpha: the alpha value of the caller
-        :param beta: the beta value of the caller
-        :param heuristic: the heuristic function to use
-        :param args: the weights
-        :return: the move with the best score for the player to take for maximizing
+        opponent_colour = Marble.BLACK.value if player_colour == Marble.WHITE.value else Marble.WHITE.value
+        original_alpha = alpha
+        best_score = -math.inf
+        best_move = None
+        ordering = self.move_ordering
+        moves = generate_moves_staged(player_colour, board, tt_move, ordering.killer_moves(ply),
+                                      ordering.history[player_colour])
+        stand_pats = {}
+        if depth == 1 and self.batch_evaluation is not None:
+            moves = self._batch_evaluated_moves(player_colour, board, moves, stand_pats)
+        for move in moves:
+            child_stand_pat = stand_pats.get(move)
+            undo = make_move(board, move, player_colour)
+            if best_move is None:
+                score = -self.negamax(opponent_colour, board, depth - 1, -beta, -alpha, ply + 1, child_stand_pat)
+            else:
+                score = -self.negamax(opponent_colour, board, depth - 1, -alpha - NULL_WINDOW, -alpha, ply + 1,
+                                      child_stand_pat)
+                if alpha < score < beta: # Null window failed high, find the real score
+                    score = -self.negamax(opponent_colour, board, depth - 1, -beta, -score, ply + 1, child_stand_pat)
+            unmake_move(board, undo)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                ordering.record_cutoff(player_colour, move, depth, ply)
+                self.search_table.store(hash_key, best_score, depth, 'lower', move)
+                return best_score
+
+        if best_move is None: # No legal moves
+            return self._evaluate(player_colour, board)
+        flag = 'upper' if best_score <= original_alpha else 'exact'
+        self.search_table.store(hash_key, best_score, depth, flag, best_move)
+        return best_score
+
+
+    def quiescence(self, player_colour: str, board: BitBoard, alpha: float, beta: float, ply: int = 0,
+                   stand_pat: float | None = None) -> float:
         """
-        entry = self.transposition_table.lookup(player_colour, board)
-        if entry and entry.depth >= depth:
+        Extends a leaf of the main search through pushes only, so positions are not scored in the middle of an
+        exchange, e.g. just before a marble is pushed off.
+
+        The player to move may stand pat with the static evaluation instead of pushing. Pushes that do not push a
+        marble off are skipped when even the heuristic's delta margin would not lift the evaluation above alpha, and
+        the sequence is cut after QUIESCENCE_MAX_PLY pushes. Results are stored in the transposition table at depth 0.
+
+        :param player_colour: the colour of the player to move
+        :param board: the current board state as a BitBoard, restored before returning
+        :param alpha: the score the player to move is already guaranteed
+        :param beta: the score the opponent is already guaranteed, as seen by the player to move
+        :param ply: the number of pushes made since the leaf
+        :param stand_pat: the static evaluation of the position if already known
+        :return: the score of the position for the player to move
+        """
+        self.nodes += 1
+        self.qnodes += 1
+        if self.nodes & CHECK_MASK == 0:
+            self.clock.check()
+
+        hash_key = board.hash ^ PLAYER_KEYS[player_colour]
+        entry = self.search_table.lookup(hash_key)
+        if entry:
             if entry.flag == 'exact':
                 return entry.value
             elif entry.flag == 'lower' and entry.value >= beta:
@@ -463,34 +657,87 @@ class MinimaxAgent:
             elif entry.flag == 'upper' and entry.value <= alpha:
                 return entry.value
 
-        if depth == 0 or terminal_test(board):
-            value = heuristic(player_colour, board, *args)
-            self.transposition_table.store(player_colour, board, value, depth, 'exact')
-            return value
+        if stand_pat is None:
+            stand_pat = self._evaluate(player_colour, board)
+        if stand_pat >= beta or ply >= QUIESCENCE_MAX_PLY or terminal_test(board):
+            return stand_pat
+
+        opponent_colour = Marble.BLACK.value if player_colour == Marble.WHITE.value else Marble.WHITE.value
+        original_alpha = alpha
+        alpha = max(alpha, stand_pat)
+        best_score = stand_pat
+        best_move = None
+        pushes = generate_push_moves(player_colour, board)
+        pushes.sort(key=lambda m: MOVE_DELTAS[m][2] != 0, reverse=True) # Push-offs first
+        for move in pushes:
+            if not MOVE_DELTAS[move][2] and stand_pat + self.delta_margin <= alpha:
+                break # Delta pruning, the remaining moves do not push a marble off either
+            undo = make_move(board, move, player_colour)
+            score = -self.quiescence(opponent_colour, board, -beta, -alpha, ply + 1)
+            unmake_move(board, undo)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.search_table.store(hash_key, best_score, 0, 'lower', move)
+                return best_score
+
+        flag = 'upper' if best_score <= original_alpha else 'exact'
+        self.search_table.store(hash_key, best_score, 0, flag, best_move)
+        return best_score
+
+
+    def _evaluate(self, player_colour: str, board: BitBoard) -> float:
+        """
+        Evaluates a position for the player to move. The heuristic scores positions for the colour the search is run
+        for, so the score is negated when the other colour is to move.
+        """
+        if self.evaluation_takes_bitboard:
+            value = self.evaluation(self.evaluation_colour, board, *self.evaluation_args)
+        else:
+            value = self.evaluation(self.evaluation_colour, board.to_dict(), *self.evaluation_args)
+        return value if player_colour == self.evaluation_colour else -value
+
+
+    def _batch_evaluated_moves(self, player_colour: str, board: BitBoard, moves: Iterator[int],
+                               stand_pats: Dict[int, float]) -> Iterator[int]:
+        """
+        Yields the moves of a node one ply from the leaves. A node whose first move does not cut off usually searches
+        all of its moves, so the children after the first are then evaluated in one batch into stand_pats before the
+        second move is yielded.
+        """
+        first_move = next(moves, None)
+        if first_move is None:
+            return
+        yield first_move
+        remaining_moves = list(moves)
+        if remaining_moves:
+            stand_pats.update(zip(remaining_moves, self._evaluate_children(player_colour, board, remaining_moves)))
+        yield from remaining_moves
 
-        v = math.inf
-        moves_generated = generate_move_dict(player_colour, board)
-        for move in moves_generated:
-            new_board = board.copy()
-            apply_move_dict(new_board, move)
-            child_value = self.max_value(
-                Marble.BLACK.value if player_colour == Marble.WHITE.value else Marble.WHITE.value,
-                new_board,
-                depth - 1,
-                alpha,
-                beta,
-                heuristic,
-                args
-            )
-            v = min(v, child_value)
-            if v <= alpha:
-                self.transposition_table.store(player_colour, board, v, depth, 'upper')
-                return v
-            beta = min(beta, v)
 
-        flag = 'exact' if alpha < v < beta else 'lower'
-        self.transposition_table.store(player_colour, board, v, depth, flag)
-        return v
+    def _evaluate_children(self, player_colour: str, board: BitBoard, moves: List[int]) -> List[float]:
+        """
+        Evaluates the positions after each of the moves with one call of the batched heuristic. The children are built
+        from the moves' cell changes without making the moves.
+
+        :return: the evaluation of each child for the player to move in it, in the order of the moves
+        """
+        blacks, whites = [], []
+        for move in moves:
+            own_delta, opp_delta, _ = MOVE_DELTAS[move]
+            if player_colour == Marble.BLACK.value:
+                blacks.append(board.black ^ own_delta)
+                whites.append(board.white ^ opp_delta)
+            else:
+                blacks.append(board.black ^ opp_delta)
+                whites.append(board.white ^ own_delta)
+        values = self.batch_evaluation(self.evaluation_colour, encode_bitboards(blacks, whites), *self.evaluation_args)
+        # The opponent is to move in the children
+        return (values if player_colour != self.evaluation_colour else -values).tolist()
+
 
     def quick_heuristic_eval(self, move: Move, player_colour: str, heuristic, args):
         """
@@ -500,77 +747,24 @@ class MinimaxAgent:
         apply_move_dict(temp_board, move)
         return heuristic(self.game_state.get_next_turn_colour(player_colour), temp_board, *args)
 
-    def get_best_move_prune(self, is_player: bool, heuristic, args, fixed_depth: int) -> Move | None:
-        alpha = -math.inf
-        beta = math.inf
-        best_move = None
-
-        # Generate moves for the current board state.
-        moves = generate_move_dict(
-            self.player_colour if is_player else self.opponent_colour,
-            self.board.marble_positions
-        )
 
-        if is_player:
-            best_score = -math.inf
-            # For each move, apply the move and evaluate it with the minimax algorithm.
-            for move in moves:
-                new_board = self.board.copy()
-                apply_move_dict(new_board, move)
-                # We subtract 1 from the depth because the current move is already made.
-                score = self.min_value(
-                    self.opponent_colour,
-                    new_board,
-                    fixed_depth - 1,
-                    alpha,
-                    beta,
-                    heuristic,
-                    args
-                )
-                if score > best_score:
-                    best_score = score
-                    best_move = move
-                alpha = max(alpha, best_score)
-        else:
-            best_score = math.inf
-            for move in moves:
-                new_board = self.board.copy()
-                apply_move_dict(new_board, move)
-                score = self.max_value(
-                    self.player_colour,
-                    new_board,
-                    fixed_depth - 1,
-                    alpha,
-                    beta,
-                    heuristic,
-                    args
-                )
-                if score < best_score:
-                    best_score = score
-                    best_move = move
-                beta = min(beta, best_score)
+    def get_best_move_prune(self, is_player: bool, heuristic, args, fixed_depth: int) -> Move | None:
+        """
+        Searches the current position to a fixed depth with the principal variation search, without a time limit.
 
-        return best_move
+        :param is_player: True to search for the player, False for the opponent
+        :param heuristic: the heuristic function to use
+        :param args: the weights
+        :param fixed_depth: the depth to search, counting the root move
+        :return: the best move, or None if there are no moves
+        """
+        self._start_search(is_player, heuristic, args, None)
+        player_colour = self.player_colour if is_player else self.opponent_colour
+        root = BitBoard.from_dict(self.board.marble_positions)
+        moves = generate_bitboard_moves(player_colour, root)
+        best_move = self._search_root(player_colour, root, moves, max(0, fixed_depth - 1), -math.inf, math.inf)[1]
+        return compact_to_move(best_move, player_colour) if best_move is not None else None
 
     def get_best_move(self, is_player: bool, heuristic, args, fixed_depth: int) -> Move | None:
-        best_score = -math.inf
-        best_move = None
-        moves = generate_move_dict(
-            self.player_colour if is_player else self.opponent_colour,
-            self.board.marble_positions
-        )
-        for move in moves:
-            new_board = self.board.copy()
-            apply_move_dict(new_board, move)
-            score = self.mini_max(
-                not is_player,
-                new_board,
-                fixed_depth,
-                heuristic,
-                args
-            )
-            if score > best_score:
-                best_score = score
-                best_move = move
-        return best_move
-
+        """Searches the current position to a fixed depth below the root move, without a time limit."""
+        return self.get_best_move_prune(is_player, heuristic, args, fixed_depth + 1)
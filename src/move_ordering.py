@@ -0,0 +1,64 @@
+"""Houses the killer move and history tables the search uses to order quiet moves."""
+from array import array
+from typing import Dict, List, Set
+
+from enums import Marble
+from moves import MOVE_KEY_SPACE, PUSH, decode_move
+
+MAX_PLY = 64 # Deepest ply with killer slots
+KILLER_SLOTS = 2
+
+
+class MoveOrdering:
+    """
+    Remembers the quiet moves that caused beta cutoffs.
+
+    Killer moves are kept per ply: a move that refuted one position is likely to refute its siblings too. The history
+    table is indexed by colour and compact move and rewards every cutoff by depth squared, so moves that cut off deep
+    in the tree are tried first anywhere. Both tables are kept across the iterations of a search, and the history is
+    aged between searches instead of being cleared. Only the few thousand moves with a score are aged, not the whole
+    table.
+    """
+
+    def __init__(self):
+        self.killers: List[List[int]] = [[] for _ in range(MAX_PLY)]
+        self.history = {
+            Marble.BLACK.value: array('q', bytes(8 * MOVE_KEY_SPACE)),
+            Marble.WHITE.value: array('q', bytes(8 * MOVE_KEY_SPACE)),
+        }
+        # The moves with a non-zero history score, per colour
+        self.scored_moves: Dict[str, Set[int]] = {colour: set() for colour in self.history}
+
+    def new_search(self) -> None:
+        """Clears the killer moves, which belong to the plies of the last search, and halves the history scores."""
+        for killers in self.killers:
+            killers.clear()
+        for colour, history in self.history.items():
+            scored_moves = self.scored_moves[colour]
+            for move in list(scored_moves):
+                history[move] >>= 1
+                if not history[move]:
+                    scored_moves.discard(move)
+
+    def killer_moves(self, ply: int) -> List[int]:
+        """Returns the killer moves of a ply, most recent first."""
+        return self.killers[ply] if ply < MAX_PLY else []
+
+    def record_cutoff(self, player_colour: str, move: int, depth: int, ply: int) -> None:
+        """
+        Rewards a move that caused a beta cutoff. Pushes are already searched early, so only quiet moves are recorded.
+
+        :param player_colour: the colour of the player who made the move
+        :param move: the compact move
+        :param depth: the remaining depth of the node that was cut off
+        :param ply: the distance of that node from the root
+        """
+        if decode_move(move)[4] == PUSH:
+            return
+        self.history[player_colour][move] += depth * depth
+        self.scored_moves[player_colour].add(move)
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[KILLER_SLOTS:]
@@ -1,6 +1,7 @@
 import re
 from dataclasses import dataclass, field
 from typing import List, Tuple
+from cells import CELLS, CELL_INDEX
 
 DIRECTIONS = {
     '→':  (1,  0, -1),  # East
@@ -11,6 +12,9 @@ DIRECTIONS = {
     '↘':  (0,  1, -1),  # Southeast
 }
 
+DIRECTION_SYMBOLS = list(DIRECTIONS)  # Direction index -> arrow symbol. The opposite of index d is (d + 3) % 6
+DIRECTION_INDEX = {symbol: index for index, symbol in enumerate(DIRECTION_SYMBOLS)}
+
 @dataclass
 class Move:
     """
@@ -103,3 +107,125 @@ def opposite_direction(direction):
         '↗': '↙',
         '↙': '↗'}
     return opposite_map.get(direction, None)
+
+
+"""
+Compact move encoding used by the search. A move is packed into a single int:
+
+  bits 0-5    anchor cell index (see cells.CELLS)
+  bits 6-8    axis: the direction index in which the rest of the group lies from the anchor
+  bits 9-10   group size (1-3)
+  bits 11-13  direction index the marbles move in
+  bits 14-15  move type, an index into MOVE_TYPES
+  bits 16-17  number of opponent marbles pushed
+
+For singles, inline moves and pushes the anchor is the leading marble and the axis points backwards, opposite to the
+direction of travel. For side-steps the axis is one of the first three directions, so every group has one encoding.
+"""
+
+MOVE_TYPES = ("single", "inline", "side_step", "push")
+MOVE_TYPE_INDEX = {move_type: index for index, move_type in enumerate(MOVE_TYPES)}
+SINGLE, INLINE, SIDE_STEP, PUSH = range(4)
+MOVE_KEY_SPACE = 1 << 18  # Every compact move is below this, so a move can index a table directly
+
+
+def encode_move(anchor: int, axis: int, size: int, direction: int, move_type: int, push_count: int = 0) -> int:
+    """
+    Packs a move into its compact int encoding.
+
+    :param anchor: the cell index of the anchor marble
+    :param axis: the direction index from the anchor to the rest of the group
+    :param size: the number of marbles moved
+    :param direction: the direction index the marbles move in
+    :param move_type: the move type index into MOVE_TYPES
+    :param push_count: the number of opponent marbles pushed
+    :return: the compact move
+    """
+    return anchor | axis << 6 | size << 9 | direction << 11 | move_type << 14 | push_count << 16
+
+
+def decode_move(code: int) -> Tuple[int, int, int, int, int, int]:
+    """
+    Unpacks a compact move.
+
+    :param code: the compact move
+    :return: (anchor, axis, size, direction, move_type, push_count)
+    """
+    return code & 0x3F, code >> 6 & 0x7, code >> 9 & 0x3, code >> 11 & 0x7, code >> 14 & 0x3, code >> 16 & 0x3
+
+
+def compact_move_cells(code: int) -> Tuple[List[Tuple[int, int, int]], List[Tuple[int, int, int]]]:
+    """
+    Returns the cells of a compact move.
+
+    :param code: the compact move
+    :return: the moved marbles, ordered from the anchor along the axis, and the pushed marbles, nearest first
+    """
+    anchor, axis, size, direction, move_type, push_count = decode_move(code)
+    aq, ar, as_ = DIRECTIONS[DIRECTION_SYMBOLS[axis]]
+    dq, dr, ds = DIRECTIONS[DIRECTION_SYMBOLS[direction]]
+    q, r, s = CELLS[anchor]
+    moved = [(q + aq * i, r + ar * i, s + as_ * i) for i in range(size)]
+    pushed = [(q + dq * i, r + dr * i, s + ds * i) for i in range(1, push_count + 1)]
+    return moved, pushed
+
+
+def compact_to_move(code: int, player: str) -> Move:
+    """
+    Converts a compact move into the equivalent Move object, for applying to a Board and for file output.
+
+    :param code: the compact move
+    :param player: the colour of the player making the move
+    :return: a Move object
+    """
+    opponent = 'w' if player == 'b' else 'b'
+    _, _, _, direction, move_type, _ = decode_move(code)
+    symbol = DIRECTION_SYMBOLS[direction]
+    dq, dr, ds = DIRECTIONS[symbol]
+    moved, pushed = compact_move_cells(code)
+    if move_type != SIDE_STEP:
+        moved.reverse()  # Trailing marble first, as in the generated Move objects
+    pushed_dest = [(q + dq, r + dr, s + ds) for q, r, s in pushed]
+
+    return Move(
+        player=player,
+        direction=symbol,
+        move_type=MOVE_TYPES[move_type],
+        moved_marbles=[(q, r, s, player) for q, r, s in moved],
+        dest_positions=[(q + dq, r + dr, s + ds, player) for q, r, s in moved],
+        push=move_type == PUSH,
+        pushed_off=bool(pushed) and pushed_dest[-1] not in CELL_INDEX,
+        pushed_marbles=[(q, r, s, opponent) for q, r, s in pushed],
+        pushed_dest_positions=[(q, r, s, opponent) for q, r, s in pushed_dest if (q, r, s) in CELL_INDEX]
+    )
+
+
+def move_to_compact(move: Move) -> int:
+    """
+    Converts a Move object into its compact encoding.
+
+    :param move: the Move to convert
+    :return: the compact move
+    """
+    direction = DIRECTION_INDEX[move.direction]
+    move_type = MOVE_TYPE_INDEX[move.move_type]
+    cells = [(q, r, s) for q, r, s, _ in move.moved_marbles]
+
+    if move_type == SIDE_STEP:
+        # Walk the line of marbles along whichever of the first three directions it lies on
+        (q0, r0, s0), (q1, r1, s1) = sorted(cells)[:2]
+        step = (q1 - q0, r1 - r0, s1 - s0)
+        axis = DIRECTION_INDEX[next(symbol for symbol, delta in DIRECTIONS.items() if delta == step)] % 3
+    else:
+        axis = (direction + 3) % 6
+
+    # The anchor is the marble furthest against the axis
+    aq, ar, as_ = DIRECTIONS[DIRECTION_SYMBOLS[axis]]
+    anchor = min(cells, key=lambda cell: cell[0] * aq + cell[1] * ar + cell[2] * as_)
+
+    return encode_move(CELL_INDEX[anchor], axis, len(cells), direction, move_type, len(move.pushed_marbles))
+
+
+def compact_to_str(code: int, player: str) -> str:
+    """Returns the notation of a compact move, as written to the move files."""
+    return str(compact_to_move(code, player))
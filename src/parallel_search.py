@@ -0,0 +1,252 @@
+"""Houses the parallel searches, which spread a search over a pool of processes sharing the transposition table."""
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
+
+from bitboard import BitBoard, generate_bitboard_moves
+from search_clock import SearchClock, SearchStopped, SAFETY_MARGIN
+
+# State of a pool process: its own copy of the agent, the alpha bound shared by the whole pool, the token of the root
+# search the bound belongs to, the event stopping its searches and the search it last worked on
+_agent = None
+_shared_alpha = None
+_root_search = None
+_stop_event = None
+_search_id = None
+
+
+def _initialize_pool_process(agent, shared_alpha, root_search, stop_event) -> None:
+    """
+    Runs once in every pool process. The agent's transposition tables are in shared memory, so every process searches
+    with the same tables as the process that started the pool.
+    """
+    global _agent, _shared_alpha, _root_search, _stop_event
+    _agent = agent
+    _shared_alpha = shared_alpha
+    _root_search = root_search
+    _stop_event = stop_event
+
+
+class _RootSearchStop:
+    """
+    Stops a pool task once the parent has left the root search the task belongs to, e.g. after a fail high of the
+    aspiration window, as well as when the pool's stop event is set. Used as the stop event of the task's clock.
+    """
+
+    def __init__(self, token: int):
+        """
+        :param token: the value of the root search counter while the task's root search runs
+        """
+        self.token = token
+
+    def is_set(self) -> bool:
+        return _root_search.value != self.token or (_stop_event is not None and _stop_event.is_set())
+
+
+def _join_search(search_id: int, is_player: bool, heuristic, args, time_left: Optional[float], stop_event=None):
+    """
+    Prepares the pool process's agent to work on a search started by the parent. The parent has already started a new
+    generation of the table, only the agent's own state is reset.
+
+    :param stop_event: the event that stops the work, the pool's stop event if None
+    :return: the agent
+    """
+    global _search_id
+    agent = _agent
+    clock = SearchClock(None if time_left is None else time_left + SAFETY_MARGIN,
+                        _stop_event if stop_event is None else stop_event)
+    if search_id != _search_id: # The first task of a new search, age the history
+        agent._start_search(is_player, heuristic, args, clock, new_generation=False)
+        _search_id = search_id
+    agent.clock = clock
+    agent.nodes = 0
+    return agent
+
+
+def _time_left(clock: SearchClock) -> Optional[float]:
+    """Returns the seconds left before the hard deadline of a search, None if it has no limit."""
+    return None if math.isinf(clock.hard_limit) else clock.hard_limit - clock.elapsed()
+
+
+def _search_root_move(search_id: int, token: int, black: int, white: int, player_colour: str, move: int, depth: int,
+                      alpha: float, beta: float, is_player: bool, heuristic, args,
+                      time_left: Optional[float]) -> Tuple[int, Optional[float], int]:
+    """
+    Searches one root move in a pool process. The move is first searched with a null window against the best alpha
+    found by any process so far, and searched again with the full window only if it beats it.
+
+    :param token: the root search the move belongs to, see _RootSearchStop
+    :return: the move, its score (only an upper bound if it is at most alpha, None if the time ran out or the root
+             search was left) and the nodes visited
+    """
+    agent = _join_search(search_id, is_player, heuristic, args, time_left, _RootSearchStop(token))
+    alpha = max(alpha, _shared_alpha.value)
+    try:
+        score = agent._search_root(player_colour, BitBoard(black, white), [move], depth, alpha, beta, True)[0]
+    except SearchStopped:
+        return move, None, agent.nodes
+    if score > alpha:
+        with _shared_alpha.get_lock():
+            # The bound may already belong to the next root search, of another depth or window
+            if _root_search.value == token and score > _shared_alpha.value:
+                _shared_alpha.value = score
+    return move, score, agent.nodes
+
+
+def _run_helper(search_id: int, black: int, white: int, player_colour: str, max_depth: int, is_player: bool, heuristic,
+                args, time_left: Optional[float], helper: int) -> int:
+    """
+    Runs iterative deepening in a pool process until the parent stops it or the maximum depth is searched. Its results
+    only reach the parent through the shared transposition table.
+
+    Odd helpers search one depth ahead of the others and every helper tries the root moves in its own random order, so
+    the helpers spread over the tree instead of repeating the parent's search.
+
+    :return: the nodes visited
+    """
+    agent = _join_search(search_id, is_player, heuristic, args, time_left)
+    root = BitBoard(black, white)
+    moves = generate_bitboard_moves(player_colour, root)
+    rng = random.Random(search_id << 8 | helper)
+    try:
+        for depth in range(1 + helper % 2, max_depth + 1):
+            rng.shuffle(moves)
+            agent._search_root(player_colour, root, moves, depth, -math.inf, math.inf)
+    except SearchStopped:
+        pass
+    return agent.nodes
+
+
+class _ProcessPoolSearch:
+    """
+    A pool of search processes kept for the whole game. The agent calls start before its first iteration, search_root
+    for every root search of its iterations and finish once it stops deepening.
+    """
+
+    def __init__(self, agent, workers: int, stop_event):
+        """
+        :param agent: the MinimaxAgent whose search is split, copied into every process
+        :param workers: the number of pool processes
+        :param stop_event: the event that stops the searches of the pool processes when set
+        """
+        self.workers = workers
+        self.shared_alpha = multiprocessing.Value('d', -math.inf)
+        # Counts the root searches split across the pool, changed under the lock of shared_alpha
+        self.root_search = multiprocessing.Value('q', 0, lock=False)
+        agent._get_search_table(False) # Create the opponent's table before the pool copies the agent
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_initialize_pool_process,
+                                            initargs=(agent, self.shared_alpha, self.root_search, stop_event))
+
+    def start(self, agent, player_colour: str, root: BitBoard, max_depth: int, is_player: bool) -> None:
+        pass
+
+    def search_root(self, agent, player_colour: str, root: BitBoard, moves: List[int], depth: int, alpha: float,
+                    beta: float, is_player: bool) -> Tuple[float, Optional[int]]:
+        """
+        Searches the root moves. Takes the same arguments and returns the same result as the agent's serial root
+        search, and raises SearchStopped when the agent's clock runs out.
+
+        :return: the best score and the move with that score. The score is only an upper bound if it is at most alpha
+        """
+        return agent._search_root(player_colour, root, moves, depth, alpha, beta)
+
+    def finish(self, agent) -> None:
+        pass
+
+    def close(self) -> None:
+        """Stops the pool. Searches still running finish at their deadline."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ParallelRootSearch(_ProcessPoolSearch):
+    """
+    Splits every root search across the pool.
+
+    The first root move is searched by the agent itself to establish a bound (young brothers wait), then the remaining
+    moves are searched by the pool. The best score so far is shared through a multiprocessing.Value so every process
+    searches against the tightest bound known. Every root search has its own token, so tasks still running when the
+    agent leaves a root search stop and do not touch the bound of the next one.
+    """
+
+    def __init__(self, agent, workers: int):
+        super().__init__(agent, workers, agent.stop_event)
+
+    def search_root(self, agent, player_colour: str, root: BitBoard, moves: List[int], depth: int, alpha: float,
+                    beta: float, is_player: bool) -> Tuple[float, Optional[int]]:
+        best_score, best_move = agent._search_root(player_colour, root, moves[:1], depth, alpha, beta)
+        alpha = max(alpha, best_score)
+        if alpha >= beta or len(moves) == 1:
+            return best_score, best_move
+
+        with self.shared_alpha.get_lock():
+            self.root_search.value += 1
+            token = self.root_search.value
+            self.shared_alpha.value = alpha
+        time_left = _time_left(agent.clock)
+        pending = {
+            self.executor.submit(_search_root_move, agent.search_count, token, root.black, root.white, player_colour,
+                                 move, depth, alpha, beta, is_player, agent.evaluation, agent.evaluation_args,
+                                 time_left)
+            for move in moves[1:]
+        }
+        try:
+            while pending:
+                timeout = None if time_left is None else max(0.0, _time_left(agent.clock))
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise SearchStopped
+                for future in done:
+                    move, score, nodes = future.result()
+                    agent.nodes += nodes
+                    if score is None:
+                        raise SearchStopped
+                    if score > best_score:
+                        best_score, best_move = score, move
+                    if score > alpha:
+                        alpha = score
+                        agent.root_best_move = move
+                        with self.shared_alpha.get_lock():
+                            self.shared_alpha.value = max(self.shared_alpha.value, alpha)
+                if alpha >= beta:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+            if pending: # Stop the tasks already running, cancel only removes the queued ones
+                with self.shared_alpha.get_lock():
+                    self.root_search.value += 1
+        return best_score, best_move
+
+
+class LazySMPSearch(_ProcessPoolSearch):
+    """
+    Runs helper searches alongside the agent's own (lazy SMP).
+
+    For the whole of the agent's iterative deepening, workers - 1 helpers run their own iterative deepening of the
+    same position with a perturbed move order. They only share the transposition table, where the agent finds the
+    bounds and best moves of the subtrees they have already searched.
+    """
+
+    def __init__(self, agent, workers: int):
+        self.stop_event = multiprocessing.Event()
+        super().__init__(agent, workers - 1, self.stop_event)
+        self.helpers = []
+
+    def start(self, agent, player_colour: str, root: BitBoard, max_depth: int, is_player: bool) -> None:
+        """Starts the helpers on the position the agent is about to search."""
+        self.stop_event.clear()
+        time_left = _time_left(agent.clock)
+        self.helpers = [
+            self.executor.submit(_run_helper, agent.search_count, root.black, root.white, player_colour, max_depth,
+                                 is_player, agent.evaluation, agent.evaluation_args, time_left, helper)
+            for helper in range(1, self.workers + 1)
+        ]
+
+    def finish(self, agent) -> None:
+        """Stops the helpers and adds the nodes they visited to the agent's."""
+        self.stop_event.set()
+        for future in self.helpers:
+            agent.nodes += future.result()
+        self.helpers = []
@@ -0,0 +1,83 @@
+"""Houses the time management used inside the search: deadlines, stop checks and iteration time predictions."""
+import time
+from typing import Optional, Tuple
+
+SAFETY_MARGIN = 0.1 # Seconds kept back from the time limit to report the move
+SOFT_LIMIT_FRACTION = 0.6 # No new iteration is started after this fraction of the hard limit
+CHECK_MASK = 7 # The clock is checked every 8 nodes, a few milliseconds apart even with the slowest heuristics
+
+
+class SearchStopped(Exception):
+    """Raised inside a search when it has run out of time or was asked to stop, unwinding it back to the root."""
+
+
+class SearchClock:
+    """
+    Tracks the time of one search.
+
+    The hard deadline is never passed: the search calls check every CHECK_MASK + 1 nodes and is unwound with
+    SearchStopped once it is reached. The soft deadline and the effective branching factor of the finished iterations
+    decide whether another iteration of iterative deepening is started at all.
+    """
+
+    def __init__(self, time_limit: Optional[float], stop_event=None, start: Optional[float] = None):
+        """
+        :param time_limit: the seconds the move may take, None for no limit
+        :param stop_event: an optional multiprocessing.Event that stops the search when set
+        :param start: the time.monotonic() at which the move's time started, e.g. in the process that asked for the
+                      search. Now if None
+        """
+        self.start = time.monotonic() if start is None else start
+        self.soft_limit, self.hard_limit = SearchClock.allocate(time_limit)
+        self.stop_event = stop_event
+        self.iteration_start = self.start
+        self.last_iteration_time = None
+        self.last_iteration_nodes = None
+        self.branching_factor = None
+
+    @staticmethod
+    def allocate(time_limit: Optional[float]) -> Tuple[float, float]:
+        """
+        Splits the time limit of a move into the soft and hard limits of its search.
+
+        :param time_limit: the seconds the move may take, None for no limit
+        :return: the soft and hard limits in seconds from the start of the search
+        """
+        if time_limit is None:
+            return float('inf'), float('inf')
+        hard_limit = max(0.0, time_limit - SAFETY_MARGIN)
+        return hard_limit * SOFT_LIMIT_FRACTION, hard_limit
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def check(self) -> None:
+        """Raises SearchStopped if the hard deadline has passed or the search was asked to stop."""
+        if self.elapsed() >= self.hard_limit or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchStopped
+
+    def start_iteration(self) -> None:
+        self.iteration_start = time.monotonic()
+
+    def finish_iteration(self, nodes: int) -> None:
+        """
+        Records the time and node count of a finished iteration, updating the effective branching factor.
+
+        :param nodes: the nodes visited by the iteration
+        """
+        if self.last_iteration_nodes:
+            self.branching_factor = nodes / self.last_iteration_nodes
+        self.last_iteration_nodes = nodes
+        self.last_iteration_time = time.monotonic() - self.iteration_start
+
+    def can_start_iteration(self) -> bool:
+        """
+        Decides whether the next iteration should be started: not after the soft deadline, nor if the time of the last
+        iteration scaled by the effective branching factor would pass the hard deadline.
+        """
+        elapsed = self.elapsed()
+        if elapsed >= self.soft_limit:
+            return False
+        if self.branching_factor is None or self.last_iteration_time is None:
+            return True
+        return elapsed + self.last_iteration_time * self.branching_factor <= self.hard_limit
@@ -0,0 +1,167 @@
+"""Houses the long-lived process that runs the agent's searches for a whole game."""
+import multiprocessing
+import time
+from typing import Dict, Optional, Tuple
+
+from moves import Move
+from search_clock import SearchClock, SAFETY_MARGIN
+
+
+class _PipeReporter:
+    """Streams the best move of every finished iteration back to the parent process."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, best_move_and_depth: Tuple[Move, int]) -> None:
+        self.connection.send(("update", best_move_and_depth))
+
+
+def _run_worker(agent, connection, stop_event) -> None:
+    """
+    The worker process loop. Waits for commands from the parent and runs the requested searches on its own copy of the
+    agent, so its transposition table and other search state stay warm between moves.
+
+    :param agent: the MinimaxAgent to search with
+    :param connection: the worker's end of the command pipe
+    :param stop_event: set by the parent when the current search must stop
+    """
+    agent.stop_event = stop_event
+    reporter = _PipeReporter(connection)
+    while True:
+        try:
+            command, payload = connection.recv()
+        except EOFError: # The parent has exited
+            command, payload = "quit", None
+        match command:
+            case "search":
+                marble_positions, is_player, heuristic, heuristic_weights, time_limit, plies_left, start = payload
+                agent.board.marble_positions.clear()
+                agent.board.marble_positions.update(marble_positions)
+                best_move = agent.iterative_deepening_search(reporter, is_player, heuristic, heuristic_weights,
+                                                             time_limit, plies_left, start=start)
+                connection.send(("done", best_move))
+            case "ponder":
+                marble_positions, heuristic, heuristic_weights, plies_left = payload
+                agent.board.marble_positions.clear()
+                agent.board.marble_positions.update(marble_positions)
+                predicted_move = agent.iterative_deepening_search(None, True, heuristic, heuristic_weights, None,
+                                                                  plies_left, ponder=True)
+                connection.send(("pondered", predicted_move))
+            case "quit":
+                agent.close_search()
+                break
+
+
+class SearchWorker:
+    """
+    A search process started once per game. The parent sends the position to search and the worker streams back the
+    best move of each finished depth until the search completes or stops itself at its deadline.
+
+    While the opponent is thinking the worker can ponder: search the position with the opponent to move until the
+    parent stops it, leaving the player's transposition table warm for the positions the opponent can reach.
+    """
+
+    def __init__(self, agent):
+        """
+        Starts the worker process with a copy of the agent.
+
+        :param agent: the MinimaxAgent whose searches the worker runs
+        """
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.stop_event = multiprocessing.Event()
+        # Not a daemon, as daemonic processes cannot start the pool of the parallel search. The worker exits on its own
+        # once the parent's end of the pipe is closed
+        self.process = multiprocessing.Process(target=_run_worker, args=(agent, worker_connection, self.stop_event))
+        self.process.start()
+        self.pondering = False
+        self.abandoned_search = False # A search the parent stopped waiting for, whose answer is still to come
+
+    def search(self, marble_positions: Dict[Tuple[int, int, int], str], is_player: bool, heuristic,
+               heuristic_weights, time_limit: float, plies_left: Optional[int] = None
+               ) -> Tuple[Optional[Move], Optional[int]]:
+        """
+        Runs an iterative deepening search in the worker. The time counts from this call. The search keeps to its hard
+        limit itself. If it has not answered by then, the stop event is set. If it still has not answered half a safety
+        margin before the time limit, the best move reported so far is returned and the late answer is discarded
+        before the next command.
+
+        :param marble_positions: the position to search from
+        :param is_player: True to search for the player, False for the opponent
+        :param heuristic: the heuristic function to use
+        :param heuristic_weights: the weights for the heuristic
+        :param time_limit: the time in seconds the search may take
+        :param plies_left: the moves left before the move limits end the game
+        :return: the best move of the deepest finished iteration and that depth, (None, None) if none finished
+        """
+        start = time.monotonic()
+        self._wait_for_abandoned_search()
+        self.stop_event.clear()
+        self.connection.send(("search", (dict(marble_positions), is_player, heuristic, heuristic_weights, time_limit,
+                                         plies_left, start)))
+        give_up_time = start + max(0.0, time_limit - SAFETY_MARGIN / 2)
+        stop_time = min(start + SearchClock.allocate(time_limit)[1], give_up_time)
+        best_move, depth = None, None
+        while True:
+            now = time.monotonic()
+            if now >= give_up_time:
+                self.stop_event.set()
+                self.abandoned_search = True
+                return best_move, depth
+            if now >= stop_time and not self.stop_event.is_set():
+                self.stop_event.set()  # The worker finishes its current node and reports back
+            if not self.connection.poll((give_up_time if self.stop_event.is_set() else stop_time) - now):
+                continue
+            message, payload = self.connection.recv()
+            if message == "update":
+                best_move, depth = payload
+            elif message == "done":
+                return best_move, depth
+
+    def _wait_for_abandoned_search(self) -> None:
+        """Waits for the answer of a search the parent stopped waiting for, which was told to stop, and discards it."""
+        while self.abandoned_search:
+            message, _ = self.connection.recv()
+            if message == "done":
+                self.abandoned_search = False
+
+    def ponder(self, marble_positions: Dict[Tuple[int, int, int], str], heuristic, heuristic_weights,
+               plies_left: Optional[int] = None) -> None:
+        """
+        Starts pondering on the position with the opponent to move and returns at once. The ponder runs until
+        stop_ponder is called, which must happen before the next search.
+
+        :param marble_positions: the position the opponent is thinking about
+        :param heuristic: the player's heuristic function
+        :param heuristic_weights: the weights for the heuristic
+        :param plies_left: the moves left before the move limits end the game
+        """
+        self._wait_for_abandoned_search()
+        self.stop_event.clear()
+        self.connection.send(("ponder", (dict(marble_positions), heuristic, heuristic_weights, plies_left)))
+        self.pondering = True
+
+    def stop_ponder(self) -> Optional[Move]:
+        """
+        Stops pondering and waits for the worker to be ready for the next search.
+
+        :return: the opponent's best move found by the ponder, None if it did not finish an iteration or no ponder ran
+        """
+        if not self.pondering:
+            return None
+        self.stop_event.set()
+        while True:
+            message, payload = self.connection.recv()
+            if message == "pondered":
+                self.pondering = False
+                return payload
+
+    def close(self) -> None:
+        """Stops the worker process."""
+        if self.process.is_alive():
+            self.stop_event.set()
+            self.connection.send(("quit", None))
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.connection.close()
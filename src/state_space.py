@@ -1,8 +1,11 @@
 import re
 
-from moves import Move, DIRECTIONS
-from typing import Dict, List, Tuple, Set
+from moves import Move, DIRECTIONS, DIRECTION_INDEX, move_to_compact, compact_move_cells
+from cells import CELLS, CELL_INDEX, NEIGHBOURS, RAYS, OFF_BOARD
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Set
 from board import Board
+from bitboard import (BitBoard, MOVE_DELTAS, MOVE_FEATURE_DELTAS, zobrist_hash, generate_push_moves, generate_inline_moves,
+                      generate_side_step_moves, generate_bitboard_moves, is_legal_move)
 from enums import Marble
 
 
@@ -14,7 +17,7 @@ INITIAL_BLACK_MARBLES= 14  # Standard Abalone setup
 INITIAL_WHITE_MARBLES= 14  # Standard Abalone setup
 
 def is_empty(pos, marble_positions):
-    return max(abs(pos[0]), abs(pos[1]), abs(pos[2])) <= 4 and pos not in marble_positions
+    return pos in CELL_INDEX and pos not in marble_positions
 
 def generate_move_dict(player: str, board: Dict[Tuple[int, int, int], str]) -> List[Move]:
     groups = get_moveable_groups_dict(player, board)
@@ -27,16 +30,20 @@ def generate_move_dict(player: str, board: Dict[Tuple[int, int, int], str]) -> L
 
 def get_single_moves_dict(player: str, marble_positions: Dict[Tuple[int, int, int], str]) -> List[Move]:
     moves = []
-    for (q, r, s), color in marble_positions.items():
+    for pos, color in marble_positions.items():
         if color != player:
             continue
-        for dir_symbol, (dq, dr, ds) in DIRECTIONS.items():
-            new_pos = (q + dq, r + dr, s + ds)
-            if is_empty(new_pos, marble_positions):
+        neighbours = CELL_INDEX[pos] * 6
+        for dir_symbol, step in DIRECTION_INDEX.items():
+            neighbour = NEIGHBOURS[neighbours + step]
+            if neighbour == OFF_BOARD:
+                continue
+            new_pos = CELLS[neighbour]
+            if new_pos not in marble_positions:
                 moves.append(Move(
                     player=player,
                     direction=dir_symbol,
-                    moved_marbles=[(q, r, s, color)],
+                    moved_marbles=[(pos[0], pos[1], pos[2], color)],
                     dest_positions=[(new_pos[0], new_pos[1], new_pos[2], color)]
                 ))
     return moves
@@ -48,40 +55,36 @@ def get_inline_moves_dict(player: str, board: Dict[Tuple[int, int, int], str],
 
     for direction, group in groups:
         dq, dr, ds = DIRECTIONS[direction]
-        next_pos = (group[-1][0] + dq, group[-1][1] + dr, group[-1][2] + ds)
+        lead = group[-1]
+        ray = RAYS[CELL_INDEX[(lead[0], lead[1], lead[2])] * 6 + DIRECTION_INDEX[direction]]
 
         # Early pruning Rule 1: Off-board or own marble ahead
-        if not is_empty(next_pos, board) and board.get(next_pos) != opponent:
+        if not ray or board.get(CELLS[ray[0]]) == player:
             continue  # prune immediately
 
         # Empty next position: valid inline move, no further checks needed
-        if is_empty(next_pos, board):
+        if CELLS[ray[0]] not in board:
             dest_positions = [(m[0] + dq, m[1] + dr, m[2] + ds, player) for m in group]
             moves.append(Move(player, direction, "inline", group, dest_positions))
             continue
 
         # Potential push move: opponent marble immediately ahead
         opponent_positions = []
-        current = next_pos
 
         # Early pruning Rule 2: Quickly evaluate if pushing is impossible
-        for _ in range(len(group)):
-            if board.get(current) == opponent:
-                opponent_positions.append(current)
-                current = (current[0] + dq, current[1] + dr, current[2] + ds)
+        for cell in ray[:len(group)]:
+            if board.get(CELLS[cell]) == opponent:
+                opponent_positions.append(CELLS[cell])
             else:
                 break
 
-        # Clearly prune if push is not valid
-        if len(opponent_positions) >= len(group) or board.get(current) == player:
+        # Clearly prune if push is not valid. The cell behind the last opponent marble may be off the board
+        if len(opponent_positions) >= len(group) or (
+                len(opponent_positions) < len(ray) and board.get(CELLS[ray[len(opponent_positions)]]) == player):
             continue  # prune invalid push
 
-        pushed_off = False
-        # if opponent_positions:
-        #     last_pos = opponent_positions[-1]
-        #     last_op_dest = (last_pos[0] + dq, last_pos[1] + dr, last_pos[2] + ds)
-        #     if max(abs(last_op_dest[0]), abs(last_op_dest[1]), abs(last_op_dest[2])) > 4:
-        #         pushed_off = True
+        # The ray stops at the edge, so if the opponent marbles fill it the last one is pushed off the board
+        pushed_off = len(opponent_positions) == len(ray)
 
         # Valid push move found
         dest_positions = [(m[0] + dq, m[1] + dr, m[2] + ds, player) for m in group]
@@ -138,13 +141,16 @@ def get_side_step_moves_dict(player: str, board: Dict[Tuple[int, int, int], str]
     moves = []
 
     for inline_direction, group in groups:
+        cells = [CELL_INDEX[(m[0], m[1], m[2])] * 6 for m in group]
         for side_direction in get_side_step_directions(inline_direction):
-            dq, dr, ds = DIRECTIONS[side_direction]
-            dest_positions = [
-                (m[0] + dq, m[1] + dr, m[2] + ds, player)
-                for m in group
-            ]
-            if all(is_empty((pos[0], pos[1], pos[2]), board) for pos in dest_positions):
+            step = DIRECTION_INDEX[side_direction]
+            neighbours = [NEIGHBOURS[cell + step] for cell in cells]
+            if all(n != OFF_BOARD and CELLS[n] not in board for n in neighbours):
+                dq, dr, ds = DIRECTIONS[side_direction]
+                dest_positions = [
+                    (m[0] + dq, m[1] + dr, m[2] + ds, player)
+                    for m in group
+                ]
                 move_obj = Move(
                     player=player,
                     direction=side_direction,
@@ -166,11 +172,9 @@ def get_marble_group_dict(start_pos: Tuple[int, int, int], direction: str, board
     (It can return up to 3 marbles if available.)
     """
     group = [(start_pos[0], start_pos[1], start_pos[2], player)]
-    dq, dr, ds = DIRECTIONS[direction]
-    current = start_pos
-    for _ in range(1, 3):
-        current = (current[0] + dq, current[1] + dr, current[2] + ds)
-        if current in board and board[current] == player:
+    for cell in RAYS[CELL_INDEX[start_pos] * 6 + DIRECTION_INDEX[direction]][:2]:
+        current = CELLS[cell]
+        if board.get(current) == player:
             group.append((current[0], current[1], current[2], player))
         else:
             break
@@ -200,6 +204,104 @@ Above are faster implementations of existing move generation functions. Uses a d
 """
 
 
+def make_move(board: BitBoard, move: int, player: str) -> Tuple[int, int, int, int, int]:
+    """
+    Applies the move to the BitBoard in place, updating its hash from the moved marbles only, its marble counts
+    when a marble is pushed off and its evaluation sums by the move's precomputed change.
+    Pass the returned undo record to unmake_move to take the move back.
+
+    :param board: the board to update
+    :param move: the compact move to make
+    :param player: the colour of the player making the move
+    :return: the undo record (black cells changed, white cells changed, pushed marbles that left the board,
+             hash before the move, evaluation sums before the move)
+    """
+    own_delta, opp_delta, pushed_off = MOVE_DELTAS[move]
+    previous_hash = board.hash
+    previous_features = board.features
+    if player == Marble.BLACK.value:
+        black_delta, white_delta = own_delta, opp_delta
+        if pushed_off:
+            board.white_count -= 1
+        board.features = previous_features + MOVE_FEATURE_DELTAS[move][0]
+    else:
+        black_delta, white_delta = opp_delta, own_delta
+        if pushed_off:
+            board.black_count -= 1
+        board.features = previous_features + MOVE_FEATURE_DELTAS[move][1]
+    board.black ^= black_delta
+    board.white ^= white_delta
+    board.hash = (previous_hash
+                  ^ zobrist_hash(black_delta, Marble.BLACK.value)
+                  ^ zobrist_hash(white_delta, Marble.WHITE.value))
+    return black_delta, white_delta, pushed_off, previous_hash, previous_features
+
+
+def unmake_move(board: BitBoard, undo: Tuple[int, int, int, int, int]) -> None:
+    """
+    Takes back a move made with make_move, restoring the BitBoard, its hash, its marble counts and its evaluation sums
+    in place.
+
+    :param board: the board to restore
+    :param undo: the undo record returned by make_move
+    """
+    board.black ^= undo[0]
+    board.white ^= undo[1]
+    board.hash = undo[3]
+    board.features = undo[4]
+    if undo[2]:
+        # The restored board holds the pushed off marble again, so its colour tells which count to restore
+        if undo[2] & board.black:
+            board.black_count += 1
+        else:
+            board.white_count += 1
+
+
+def generate_moves_staged(player: str, board: BitBoard, tt_move: Optional[int] = None,
+                          killers: Sequence[int] = (), history: Optional[Sequence[int]] = None) -> Iterator[int]:
+    """
+    Lazily yields the player's legal compact moves in stages, most promising first:
+    the transposition table move, push-offs, other pushes, killer moves, singles and inline moves, then side-steps.
+
+    A stage is only generated once the previous one is exhausted, so a search that cuts off early never pays for
+    generating the quiet moves. The board may be changed between yields as long as it is restored before the next one.
+
+    :param player: the colour of the player to move
+    :param board: the board as a BitBoard
+    :param tt_move: the best move stored for this position, if any
+    :param killers: quiet moves that caused a cutoff in sibling positions
+    :param history: the player's history scores indexed by compact move, quiet moves within a stage are tried in
+                    descending order of score
+    :return: an iterator over compact moves, each yielded once
+    """
+    yielded = set()
+    if tt_move is not None and is_legal_move(player, board, tt_move):
+        yielded.add(tt_move)
+        yield tt_move
+
+    pushes = generate_push_moves(player, board)
+    for move in pushes:
+        if MOVE_DELTAS[move][2] and move not in yielded:
+            yield move
+    for move in pushes:
+        if not MOVE_DELTAS[move][2] and move not in yielded:
+            yield move
+    yielded.update(pushes)
+
+    for move in killers:
+        if move not in yielded and is_legal_move(player, board, move):
+            yielded.add(move)
+            yield move
+
+    for generate in (generate_inline_moves, generate_side_step_moves):
+        quiet_moves = generate(player, board)
+        if history is not None:
+            quiet_moves.sort(key=history.__getitem__, reverse=True)
+        for move in quiet_moves:
+            if move not in yielded:
+                yield move
+
+
 def generate_move(player: str, board: Board) -> List[Move]:
     """
     Generates all possible legal moves given the player whose turn it is an a board configuration.
@@ -477,6 +579,108 @@ def parse_move_str(move_str: str) -> Move:
     )
 
 
+def encode_external_move(move: Move | str) -> Optional[int]:
+    """
+    Encodes a move from outside the search, e.g. typed by a human or read from a file, checking that the compact move
+    describes exactly the marbles the move names.
+
+    :param move: a Move or a move string, e.g. (0,0,0,b)→(1,0,-1,b)
+    :return: the compact move, None if the move is malformed or names marbles no single move can move together
+    """
+    try:
+        if isinstance(move, str):
+            move = parse_move_str(move)
+        code = move_to_compact(move)
+    except (ValueError, KeyError, IndexError, StopIteration):
+        return None
+    if code not in MOVE_DELTAS:
+        return None
+    moved, pushed = compact_move_cells(code)
+    if (sorted(moved) != sorted((q, r, s) for q, r, s, _ in move.moved_marbles)
+            or sorted(pushed) != sorted((q, r, s) for q, r, s, _ in move.pushed_marbles)):
+        return None
+    return code
+
+
+class LegalMoveIndex:
+    """
+    The legal moves of one position, generated once and indexed by compact move and by the hash of the position each
+    leads to. Validating a move, finding the move between two positions and spotting generated moves that lead to the
+    same position are then dictionary lookups.
+    """
+
+    def __init__(self, player: str, board: BitBoard):
+        """
+        :param player: the colour of the player to move
+        :param board: the position, copied
+        """
+        self.player = player
+        self.board = board.copy()
+        self.moves: Dict[int, int] = {} # Compact move -> hash of the position it leads to
+        self.results: Dict[int, int] = {} # Hash of a position -> the first generated move leading to it
+        self.duplicates: List[int] = [] # Generated moves leading to a position an earlier move already leads to
+        for move in generate_bitboard_moves(player, self.board):
+            undo = make_move(self.board, move, player)
+            result = self.board.hash
+            unmake_move(self.board, undo)
+            self.moves[move] = result
+            if result in self.results:
+                self.duplicates.append(move)
+            else:
+                self.results[result] = move
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def __contains__(self, move: int) -> bool:
+        return move in self.moves
+
+    def canonical(self, move: int | Move | str) -> Optional[int]:
+        """
+        Returns the generated move equivalent to a move, which may be encoded differently, e.g. an inline move named
+        from its other end.
+
+        :param move: a compact move, a Move or a move string
+        :return: the generated compact move, None if the move is not legal in this position
+        """
+        code = move if isinstance(move, int) else encode_external_move(move)
+        if code in self.moves:
+            return code
+        if code is None or not is_legal_move(self.player, self.board, code):
+            return None
+        undo = make_move(self.board, code, self.player)
+        result = self.board.hash
+        unmake_move(self.board, undo)
+        return self.results.get(result)
+
+    def is_legal(self, move: int | Move | str) -> bool:
+        """
+        Checks whether a move is legal in this position.
+
+        :param move: a compact move, a Move or a move string
+        """
+        return self.canonical(move) is not None
+
+    def find(self, after: BitBoard) -> Optional[int]:
+        """
+        Finds the move that leads to a position.
+
+        :param after: the position after the move
+        :return: the generated compact move, None if no legal move leads to the position
+        """
+        move = self.results.get(after.hash)
+        if move is None:
+            return None
+        own_delta, opp_delta, _ = MOVE_DELTAS[move] # Rule out a hash collision
+        if self.player == Marble.BLACK.value:
+            black_delta, white_delta = own_delta, opp_delta
+        else:
+            black_delta, white_delta = opp_delta, own_delta
+        if (self.board.black ^ black_delta, self.board.white ^ white_delta) != (after.black, after.white):
+            return None
+        return move
+
+
 def apply_move_obj(board_obj: Board, move: Move) -> None:
     """
     Applies the given Move object to the Board object in place.
@@ -528,15 +732,18 @@ def apply_move_obj(board_obj: Board, move: Move) -> None:
 def get_score(board: Dict[Tuple[int, int, int], str]):
     """
     Calculates the score for both players based on the number of opponent marbles pushed off the board.
+    A BitBoard keeps its marble counts up to date, so its score is read in constant time.
 
-    :param board: A Board object representing the initial board configuration
+    :param board: A marble positions dictionary or a BitBoard
     :return: Dictionary with scores {'b': int, 'w': int}
     """
+    if isinstance(board, BitBoard):
+        current_black_marbles, current_white_marbles = board.black_count, board.white_count
+    else:
+        board_dict_values = board.values()
 
-    board_dict_values = board.values()
-
-    current_black_marbles = sum(1 for v in board_dict_values if v == Marble.BLACK.value)
-    current_white_marbles = sum(1 for v in board_dict_values if v == Marble.WHITE.value)
+        current_black_marbles = sum(1 for v in board_dict_values if v == Marble.BLACK.value)
+        current_white_marbles = sum(1 for v in board_dict_values if v == Marble.WHITE.value)
 
     black_score = INITIAL_WHITE_MARBLES - current_white_marbles  # Black's score = White marbles pushed off
     white_score = INITIAL_BLACK_MARBLES - current_black_marbles  # White's score = Black marbles pushed off
@@ -564,6 +771,13 @@ def check_win(board: Dict[Tuple[int, int, int], str]):
     :param board: A Board object representing the initial board configuration
     :return: 'b' if black wins, 'w' if white wins, None if no winner 
     """
+    if isinstance(board, BitBoard):
+        # Avoid building the score dictionary at every search node
+        if board.white_count <= INITIAL_WHITE_MARBLES - 6:
+            return Marble.BLACK.value
+        if board.black_count <= INITIAL_BLACK_MARBLES - 6:
+            return Marble.WHITE.value
+        return None
     score = get_score(board)
     if score[Marble.BLACK.value] >= 6:
         return Marble.BLACK.value
@@ -575,8 +789,13 @@ def check_win(board: Dict[Tuple[int, int, int], str]):
 def apply_move(board_obj: Board, move_str: str) -> None:
     """
     Parses move_str into a Move object and applies it to the Board object.
+
+    :raises ValueError: if the move is malformed or not legal on the board
     """
     move = parse_move_str(move_str)
+    code = encode_external_move(move)
+    if code is None or not is_legal_move(move.player, BitBoard.from_dict(board_obj.marble_positions), code):
+        raise ValueError(f"Illegal move: {move_str}")
     apply_move_obj(board_obj, move)
 
 def game_status(board: Dict[Tuple[int, int, int], str]) -> str:
@@ -1,57 +1,230 @@
+import ctypes
 import random
-from typing import Dict, Tuple, Optional
+import struct
+from multiprocessing import RawArray
+from typing import Dict, List, Tuple, Optional
+from cells import CELL_INDEX, NUM_CELLS
+
+
+def _initialize_zobrist() -> Tuple[Dict[str, List[int]], Dict[str, int]]:
+    """
+    Precomputes random 64-bit values for each (cell, piece) combination and for each player to move.
+
+    The keys are shared by every board and table so a hash can be carried alongside a board and updated as moves are
+    made, instead of being recomputed from every marble.
+    """
+    rng = random.Random(42)  # Ensures reproducibility and consistency
+    pieces = ['w', 'b']
+    keys = {piece: [rng.getrandbits(64) for _ in range(NUM_CELLS)] for piece in pieces}
+    player_keys = {'b': rng.getrandbits(64), 'w': rng.getrandbits(64)}
+    return keys, player_keys
+
+ZOBRIST_KEYS, PLAYER_KEYS = _initialize_zobrist()
 
 class TranspositionEntry:
     """Represents an entry in the transposition table."""
-    def __init__(self, value: float, depth: int, flag: str):
+    __slots__ = ("value", "depth", "flag", "best_move")
+
+    def __init__(self, value: float, depth: int, flag: str, best_move: Optional[int] = None):
         """
         :param value: The heuristic value of the game state
         :param depth: The depth at which this value was calculated
         :param flag: 'exact', 'lower', or 'upper' to indicate the type of bound
+        :param best_move: the compact move that was best or caused the cutoff, tried first when the state is searched again
         """
         self.value = value
         self.depth = depth
         self.flag = flag
+        self.best_move = best_move
+
+# Bound flags packed into an entry, 0 marks an empty slot
+FLAG_CODES = {'exact': 1, 'lower': 2, 'upper': 3}
+FLAG_NAMES = {code: flag for flag, code in FLAG_CODES.items()}
+
+BUCKET_SIZE = 4  # The first three slots of a bucket keep the deepest entries, the last one always takes the newest
+ENTRY_BYTES = 24  # 8 bytes each for the key, the value and the packed depth, flag, generation and move
+DEPTH_BITS = 8
+FLAG_BITS = 2
+GENERATION_BITS = 6
+MOVE_SHIFT = DEPTH_BITS + FLAG_BITS + GENERATION_BITS
+DEPTH_MASK = (1 << DEPTH_BITS) - 1
+GENERATION_MASK = (1 << GENERATION_BITS) - 1
+
+# Slots of the shared counters array
+GENERATION, PROBES, HITS, OLD_HITS, STORES = range(5)
+
+_DOUBLE = struct.Struct('d')
+_QWORD = struct.Struct('Q')
+
+
+def _value_bits(value: float) -> int:
+    """Returns the 64 bits of a float, as XORed into the stored key."""
+    return _QWORD.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_value(bits: int) -> float:
+    """Returns the float with the given 64 bits."""
+    return _DOUBLE.unpack(_QWORD.pack(bits))[0]
+
+
+def _shared_view(raw: RawArray, typecode: str) -> memoryview:
+    """Returns a typed memoryview over a shared ctypes array, which indexes as fast as an array.array."""
+    return memoryview(raw).cast('B').cast(typecode)
+
 
 class TranspositionTable:
-    """A transposition table to cache game state evaluations for performance enhancement."""
-    def __init__(self):
-        random.seed(42)  # Ensures reproducibility and consistency
-        self.table: Dict[int, TranspositionEntry] = {}
-        self.zobrist_table = self._initialize_zobrist()
-        self.player_hash = {'b': random.getrandbits(64), 'w': random.getrandbits(64)}
-
-    def _initialize_zobrist(self) -> Dict[Tuple[Tuple[int, int, int], str], int]:
-        """Precomputes random 64-bit values for each (position, piece) combination."""
-        positions = [
-            (q, r, s)
-            for q in range(-4, 5)
-            for r in range(-4, 5)
-            for s in range(-4, 5)
-            if q + r + s == 0
-        ]
-        pieces = ['w', 'b']
-        return {(pos, piece): random.getrandbits(64) for pos in positions for piece in pieces}
-
-
-    def hash_game_state(self, player: str, board: Dict[Tuple[int, int, int], str]) -> int:
-        """Computes a Zobrist hash quickly and consistently."""
+    """
+    A fixed-size transposition table to cache game state evaluations for performance enhancement.
+
+    Entries live in three preallocated arrays (key, value, packed depth/flag/generation/best move) split into buckets
+    of BUCKET_SIZE slots, so memory stays flat however long the game runs. A key is mapped to its bucket by its low bits
+    and the full key is stored to tell positions sharing a bucket apart.
+
+    The table is kept for the whole game. Each search starts a new generation with new_search, and entries written by
+    earlier generations are replaced first. The arrays are allocated in shared memory, so a search run in a child
+    process writes into the same table as its parent, and several processes may search with it at once.
+
+    Processes read and write the table without locking. The stored key is the position's key XORed with the entry's
+    value and packed data, so an entry torn by two processes writing it at the same time no longer matches its key and
+    is read as a miss instead of returning another position's data.
+    """
+    DEFAULT_SIZE_MB = 64
+
+    def __init__(self, size_mb: int = DEFAULT_SIZE_MB):
+        """
+        :param size_mb: the memory to allocate for the table in megabytes, rounded down to a power of two of buckets
+        """
+        buckets = max(1, size_mb * 1024 * 1024 // (ENTRY_BYTES * BUCKET_SIZE))
+        self.bucket_mask = (1 << (buckets.bit_length() - 1)) - 1
+        self.capacity = (self.bucket_mask + 1) * BUCKET_SIZE
+        self._raw = (RawArray('Q', self.capacity), RawArray('d', self.capacity), RawArray('Q', self.capacity),
+                     RawArray('Q', STORES + 1))
+        self._attach()
+
+    def _attach(self) -> None:
+        """Creates the typed views used to read and write the shared arrays."""
+        keys, values, data, counters = self._raw
+        self.keys = _shared_view(keys, 'Q')
+        self.values = _shared_view(values, 'd')
+        self.value_bits = _shared_view(values, 'Q')
+        self.data = _shared_view(data, 'Q')
+        self.counters = _shared_view(counters, 'Q')
+
+    def __getstate__(self):
+        # Memoryviews cannot be pickled, the shared arrays are sent to the child process and the views rebuilt there
+        return {'bucket_mask': self.bucket_mask, 'capacity': self.capacity, '_raw': self._raw}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    @staticmethod
+    def hash_game_state(player: str, board: Dict[Tuple[int, int, int], str]) -> int:
+        """
+        Computes a Zobrist hash from scratch. Boards used by the search carry this hash and keep it up to date instead,
+        see BitBoard.hash.
+        """
         hash_value = 0
         for pos, piece in board.items():
-            hash_value ^= self.zobrist_table[(pos, piece)]
-        hash_value ^= self.player_hash[player]  # Differentiates between players clearly
+            hash_value ^= ZOBRIST_KEYS[piece][CELL_INDEX[pos]]
+        hash_value ^= PLAYER_KEYS[player]  # Differentiates between players clearly
         return hash_value
 
-    def lookup(self, player: str, board: Dict[Tuple[int, int, int], str]) -> Optional[TranspositionEntry]:
-        """Retrieves an entry from the transposition table if it exists."""
-        return self.table.get(self.hash_game_state(player, board))
+    @property
+    def generation(self) -> int:
+        return self.counters[GENERATION]
 
-    def store(self, player: str, board: Dict[Tuple[int, int, int], str], value: float, depth: int, flag: str) -> None:
-        """Stores an entry using depth-based replacement policy."""
-        hash_key = self.hash_game_state(player, board)
-        if hash_key not in self.table or depth >= self.table[hash_key].depth:
-            self.table[hash_key] = TranspositionEntry(value, depth, flag)
+    def new_search(self) -> None:
+        """Starts a new generation. Entries from earlier searches stay usable but are the first to be replaced."""
+        self.counters[GENERATION] = self.counters[GENERATION] % GENERATION_MASK + 1
+
+    def _find(self, hash_key: int) -> Tuple[int, int, int]:
+        """
+        Returns the slot holding the key with the entry's data and value bits as read while verifying it, or -1 if the
+        key is not in the table. The entry must not be read again, another process may have replaced it since.
+        """
+        slot = (hash_key & self.bucket_mask) * BUCKET_SIZE
+        keys, data, value_bits = self.keys, self.data, self.value_bits
+        for index in range(slot, slot + BUCKET_SIZE):
+            entry_data, entry_value = data[index], value_bits[index]
+            if entry_data and keys[index] ^ entry_data ^ entry_value == hash_key:
+                return index, entry_data, entry_value
+        return -1, 0, 0
+
+    def lookup(self, hash_key: int) -> Optional[TranspositionEntry]:
+        """
+        Retrieves an entry from the transposition table if it exists.
+
+        :param hash_key: the Zobrist hash of the board combined with the player to move
+        """
+        counters = self.counters
+        counters[PROBES] += 1
+        index, data, value = self._find(hash_key)
+        if index < 0:
+            return None
+        counters[HITS] += 1
+        if data >> (DEPTH_BITS + FLAG_BITS) & GENERATION_MASK != counters[GENERATION]:
+            counters[OLD_HITS] += 1
+        move = data >> MOVE_SHIFT
+        return TranspositionEntry(
+            _bits_value(value),
+            data & DEPTH_MASK,
+            FLAG_NAMES[data >> DEPTH_BITS & ((1 << FLAG_BITS) - 1)],
+            move - 1 if move else None
+        )
+
+    def _replace_priority(self, index: int) -> Tuple[bool, bool, int]:
+        """Orders slots for replacement: empty slots first, then entries of earlier searches, then shallow entries."""
+        data = self.data[index]
+        return data != 0, data >> (DEPTH_BITS + FLAG_BITS) & GENERATION_MASK == self.counters[GENERATION], data & DEPTH_MASK
+
+    def store(self, hash_key: int, value: float, depth: int, flag: str, best_move: Optional[int] = None) -> None:
+        """
+        Stores an entry. An entry for the same key is replaced if the new search was at least as deep or the entry is
+        from an earlier search. Otherwise the empty, stale or shallowest depth-preferred slot of the bucket is replaced
+        if it is stale or the new search is at least as deep, and the always-replace slot is used if not.
+
+        :param hash_key: the Zobrist hash of the board combined with the player to move
+        :param best_move: the compact move that was best or caused the cutoff, if any
+        """
+        keys, data = self.keys, self.data
+        generation = self.counters[GENERATION]
+        index, current, _ = self._find(hash_key)
+        if index >= 0:
+            if depth < current & DEPTH_MASK and current >> (DEPTH_BITS + FLAG_BITS) & GENERATION_MASK == generation:
+                return
+            if best_move is None:
+                best_move = (current >> MOVE_SHIFT) - 1  # Keep the move of a shallower or older search
+                best_move = None if best_move < 0 else best_move
+        else:
+            slot = (hash_key & self.bucket_mask) * BUCKET_SIZE
+            index = min(range(slot, slot + BUCKET_SIZE - 1), key=self._replace_priority)
+            occupied, current_generation, stored_depth = self._replace_priority(index)
+            if occupied and current_generation and depth < stored_depth:
+                index = slot + BUCKET_SIZE - 1
+        entry_data = ((0 if best_move is None else best_move + 1) << MOVE_SHIFT
+                      | generation << (DEPTH_BITS + FLAG_BITS)
+                      | FLAG_CODES[flag] << DEPTH_BITS
+                      | min(depth, DEPTH_MASK))
+        self.values[index] = value
+        data[index] = entry_data
+        keys[index] = hash_key ^ entry_data ^ _value_bits(value)
+        self.counters[STORES] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the table counters since it was created: probes, hits, hits on entries stored by an earlier search
+        (e.g. the search two plies ago) and stores. Processes searching together may lose some of each other's counts.
+        """
+        counters = self.counters
+        return {
+            'probes': counters[PROBES],
+            'hits': counters[HITS],
+            'old_hits': counters[OLD_HITS],
+            'stores': counters[STORES],
+        }
 
     def clear(self) -> None:
-        """Clears the transposition table."""
-        self.table.clear()
+        """Clears the transposition table and its counters."""
+        for raw in self._raw:
+            ctypes.memset(raw, 0, ctypes.sizeof(raw))